@@ -12,6 +12,8 @@
         - Intelligent data extraction and formatting
         - Google Sheets integration with automatic synchronization
         - Mexican EDI support (UUID, CFDI) for invoices
+        - Background export queue processed by a scheduled action
+        - Export run log with timing spans, API counters and an optional Prometheus text dump
     """,
     'author': "Adriano",
     'website': "https://www.github.com/Adrianovaldes",
@@ -19,7 +21,15 @@
     'version': '17.0.1.0.0',
     'depends': ['sale_management', 'base_setup', 'account', 'l10n_mx_edi'],
     'data': [
+        'security/ir.model.access.csv',
+        'data/ir_cron.xml',
+        'data/prompt_classification_rule_data.xml',
         'views/res_config_settings_views.xml',
+        'views/prompt_export_job_views.xml',
+        'views/prompt_export_run_views.xml',
+        'views/prompt_classification_rule_views.xml',
+        'views/prompt_rebuild_wizard_views.xml',
+        'views/prompt_reconcile_wizard_views.xml',
         'views/sale_order_view.xml',
         'views/account_move_view.xml',
     ],
@@ -1,4 +1,16 @@
 # -*- coding: utf-8 -*-
+from . import prompt_settings
 from . import res_config_settings
+from . import sheet_connection
+from . import prompt_sync_engine
+from . import prompt_rate_service
+from . import prompt_classification_rule
+from . import res_currency_rate
+from . import prompt_sheet_index
+from . import prompt_export_job
+from . import prompt_export_run
+from . import prompt_sync_watermark
 from . import sale_order
-from . import account_move 
\ No newline at end of file
+from . import account_move
+from . import prompt_rebuild_wizard
+from . import prompt_reconcile_wizard
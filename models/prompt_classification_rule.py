@@ -0,0 +1,81 @@
+# -*- coding: utf-8 -*-
+
+from odoo import models, fields, api, tools, _
+from odoo.exceptions import ValidationError
+
+from ..tools.classifier import CompiledRules, ProductClassifier, Rule
+
+TIPOS = [
+    ('FABRICACION', 'Fabricación'),
+    ('COMERCIAL', 'Comercial'),
+]
+
+
+class PromptClassificationRule(models.Model):
+    _name = 'prompt.classification.rule'
+    _description = 'Product Classification Rule for Prompt Extractor'
+    _order = 'sequence, id'
+
+    name = fields.Char(required=True)
+    sequence = fields.Integer(default=10)
+    active = fields.Boolean(default=True)
+    match_type = fields.Selection([
+        ('keyword', 'Keyword in Product Name'),
+        ('category', 'Product Category'),
+        ('tag', 'Product Tag'),
+    ], required=True, default='keyword')
+    keyword = fields.Char(help='Case-insensitive text searched in the product name (without internal reference).')
+    categ_id = fields.Many2one('product.category', string='Product Category', ondelete='cascade',
+                               help='Also applies to the child categories.')
+    tag_id = fields.Many2one('product.tag', string='Product Tag', ondelete='cascade')
+    tipo = fields.Selection(TIPOS, string='Type', help='Value of the TIPO / CATEGORIA column. Leave empty to only override the family.')
+    familia = fields.Char(string='Family', help='Overrides the FAMILIA column (by default the product category).')
+
+    @api.constrains('match_type', 'keyword', 'categ_id', 'tag_id', 'tipo', 'familia')
+    def _check_rule(self):
+        for rule in self:
+            if rule.match_type == 'keyword' and not (rule.keyword or '').strip():
+                raise ValidationError(_("Rule '%s' needs a keyword.", rule.name))
+            if rule.match_type == 'category' and not rule.categ_id:
+                raise ValidationError(_("Rule '%s' needs a product category.", rule.name))
+            if rule.match_type == 'tag' and not rule.tag_id:
+                raise ValidationError(_("Rule '%s' needs a product tag.", rule.name))
+            if not rule.tipo and not rule.familia:
+                raise ValidationError(_("Rule '%s' must set a type or a family.", rule.name))
+
+    # ---------------------------------------------------------------------
+    # Caché de reglas compiladas
+    # ---------------------------------------------------------------------
+
+    @api.model_create_multi
+    def create(self, vals_list):
+        self.env.registry.clear_cache()
+        return super().create(vals_list)
+
+    def write(self, vals):
+        self.env.registry.clear_cache()
+        return super().write(vals)
+
+    def unlink(self):
+        self.env.registry.clear_cache()
+        return super().unlink()
+
+    @api.model
+    @tools.ormcache()
+    def _get_compiled_rules(self):
+        """Reglas activas compiladas una sola vez por proceso hasta que se modifiquen."""
+        values = {
+            'keyword': lambda rule: rule.keyword.strip(),
+            'category': lambda rule: rule.categ_id.id,
+            'tag': lambda rule: rule.tag_id.id,
+        }
+        return CompiledRules([
+            Rule(rule.id, rule.sequence, rule.match_type, values[rule.match_type](rule),
+                 rule.tipo or None, (rule.familia or '').strip() or None)
+            for rule in self.sudo().search([])
+        ])
+
+    @api.model
+    def _get_classifier(self):
+        """Clasificador nuevo (con su propia caché por producto) para un lote de exportación."""
+        return ProductClassifier(self._get_compiled_rules())
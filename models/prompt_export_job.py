@@ -0,0 +1,326 @@
+# -*- coding: utf-8 -*-
+
+import json
+import logging
+import time
+from datetime import timedelta
+
+from odoo import models, fields, api, _
+from odoo.exceptions import UserError
+
+from ..tools import metrics
+from ..tools.retry import call_with_retry, is_stale_worksheet_error, is_transient_error
+from ..tools.sheet_connection import SHEET_CONNECTIONS
+from ..tools.sheet_rebuild import SheetRebuildSink, prepare_rebuild, staging_title, swap_worksheets
+from ..tools.sinks import STAT_KEYS
+from .sheet_connection import WorksheetBusy
+
+_logger = logging.getLogger(__name__)
+
+MAX_ATTEMPTS = 5
+# Tiempo máximo de una ejecución del cron antes de ceder el worker
+MAX_RUN_SECONDS = 240
+# Espera antes de reintentar un lote cuya hoja está ocupada por otra exportación
+BUSY_RETRY_DELAY = timedelta(minutes=1)
+
+
+class PromptExportJob(models.Model):
+    _name = 'prompt.export.job'
+    _description = 'Google Sheets Export Job'
+    _order = 'id desc'
+
+    name = fields.Char(required=True, readonly=True)
+    res_model = fields.Selection([
+        ('sale.order', 'Sale Orders'),
+        ('account.move', 'Invoices'),
+    ], string='Document Type', required=True, readonly=True)
+    state = fields.Selection([
+        ('pending', 'Pending'),
+        ('running', 'Running'),
+        ('done', 'Done'),
+        ('failed', 'Failed'),
+        ('merged', 'Merged'),
+    ], default='pending', required=True, readonly=True, index=True)
+    mode = fields.Selection([
+        ('upsert', 'Update Rows'),
+        ('rebuild', 'Rebuild Worksheet'),
+    ], default='upsert', required=True, readonly=True)
+    worksheet_name = fields.Char(readonly=True, help='Worksheet replaced by a rebuild job.')
+    use_staging = fields.Boolean(readonly=True, help='Write the rebuilt rows to a staging worksheet and swap it at the end.')
+    next_row = fields.Integer(readonly=True, help='Worksheet row where the next chunk of a rebuild is written (0 = not started).')
+    merged_into_id = fields.Many2one('prompt.export.job', string='Merged Into', readonly=True,
+                                     help='Job that exports the records of this request.')
+    user_id = fields.Many2one('res.users', string='Requested By', default=lambda self: self.env.user, readonly=True)
+    pending_ids = fields.Text(default='[]', readonly=True, help='JSON list of record ids not exported yet.')
+    record_count = fields.Integer(string='Records', readonly=True)
+    processed_count = fields.Integer(string='Processed', readonly=True)
+    progress = fields.Float(compute='_compute_progress')
+    attempts = fields.Integer(readonly=True)
+    next_attempt = fields.Datetime(readonly=True)
+    last_error = fields.Text(readonly=True)
+    date_done = fields.Datetime(readonly=True)
+    rows_unchanged = fields.Integer(readonly=True)
+    rows_updated = fields.Integer(readonly=True)
+    rows_inserted = fields.Integer(readonly=True)
+    rows_removed = fields.Integer(readonly=True)
+
+    @api.depends('record_count', 'processed_count')
+    def _compute_progress(self):
+        for job in self:
+            job.progress = 100.0 * job.processed_count / job.record_count if job.record_count else 0.0
+
+    # ---------------------------------------------------------------------
+    # Encolado
+    # ---------------------------------------------------------------------
+
+    def _get_pending_ids(self):
+        self.ensure_one()
+        return json.loads(self.pending_ids or '[]')
+
+    @api.model
+    def _enqueue(self, res_model, res_ids):
+        """Añade ``res_ids`` a la cola de ``res_model`` y despierta al cron.
+
+        Si ya hay un trabajo pendiente del mismo modelo, los ids se fusionan en
+        él en lugar de crear otro, aunque lo haya pedido otro usuario. Los
+        trabajos leen los documentos como superusuario, así que el acceso de
+        quien los pide se comprueba aquí.
+        """
+        records = self.env[res_model].browse(res_ids)
+        records.check_access_rights('read')
+        records.check_access_rule('read')
+        job = self.sudo().search([
+            ('res_model', '=', res_model),
+            ('mode', '=', 'upsert'),
+            ('state', '=', 'pending'),
+        ], limit=1, order='id')
+        if job:
+            pending = job._get_pending_ids()
+            known = set(pending)
+            new_ids = [res_id for res_id in res_ids if res_id not in known]
+            job.write({
+                'pending_ids': json.dumps(pending + new_ids),
+                'record_count': job.record_count + len(new_ids),
+            })
+        else:
+            label = dict(self._fields['res_model'].selection)[res_model]
+            job = self.sudo().create({
+                'name': '%s (%s)' % (label, fields.Datetime.to_string(fields.Datetime.now())),
+                'res_model': res_model,
+                'pending_ids': json.dumps(list(res_ids)),
+                'record_count': len(res_ids),
+            })
+        self.env.ref('sale_order_prompt_extractor.ir_cron_prompt_export_job')._trigger()
+        return job
+
+    @api.model
+    def _enqueue_rebuild(self, res_model, res_ids, worksheet_name, use_staging=True):
+        """Crea un trabajo que reescribe ``worksheet_name`` con las filas de ``res_ids``, en ese orden."""
+        label = dict(self._fields['mode'].selection)['rebuild']
+        job = self.sudo().create({
+            'name': '%s: %s (%s)' % (label, worksheet_name, fields.Datetime.to_string(fields.Datetime.now())),
+            'res_model': res_model,
+            'mode': 'rebuild',
+            'worksheet_name': worksheet_name,
+            'use_staging': use_staging,
+            'pending_ids': json.dumps(list(res_ids)),
+            'record_count': len(res_ids),
+        })
+        self.env.ref('sale_order_prompt_extractor.ir_cron_prompt_export_job')._trigger()
+        return job
+
+    # ---------------------------------------------------------------------
+    # Procesamiento (cron)
+    # ---------------------------------------------------------------------
+
+    @api.model
+    def _cron_process_jobs(self):
+        """Vacía la cola por lotes, confirmando la transacción después de cada uno."""
+        deadline = time.monotonic() + MAX_RUN_SECONDS
+        chunk_size = self.env['prompt.settings']._get_settings().export_chunk_size
+        # Un trabajo 'running' sólo puede venir de una ejecución interrumpida
+        jobs = self.search([
+            ('state', 'in', ('pending', 'running')),
+            '|', ('next_attempt', '=', False), ('next_attempt', '<=', fields.Datetime.now()),
+        ], order='id')
+        for job in jobs:
+            if job.state not in ('pending', 'running'):
+                # Fusionado en un trabajo anterior durante esta misma ejecución
+                continue
+            while time.monotonic() < deadline:
+                more = job._process_chunk(chunk_size)
+                self.env.cr.commit()
+                if not more:
+                    break
+            if time.monotonic() >= deadline:
+                # Quedan trabajos: volver a ejecutar en cuanto sea posible
+                self.env.ref('sale_order_prompt_extractor.ir_cron_prompt_export_job')._trigger()
+                break
+
+    def _process_chunk(self, chunk_size):
+        """Exporta el siguiente lote; devuelve True si el trabajo debe continuar ya."""
+        self.ensure_one()
+        if self.mode == 'upsert':
+            self._absorb_pending_jobs()
+        pending = self._get_pending_ids()
+        if not pending:
+            self.write({'state': 'done', 'date_done': fields.Datetime.now()})
+            return False
+        chunk, rest = pending[:chunk_size], pending[chunk_size:]
+        self.write({'state': 'running'})
+
+        # El acceso se comprobó al encolar: un trabajo reúne peticiones de varios
+        # usuarios y la reconstrucción escribe la hoja de todas las empresas que la comparten
+        records = self.env[self.res_model].with_user(self.user_id).sudo().browse(chunk).exists()
+        try:
+            with self.env['prompt.export.run']._track(self.res_model, len(records), job=self):
+                with self.env.cr.savepoint():
+                    if self.mode == 'rebuild':
+                        stats = self._rebuild_chunk(records, last=not rest)
+                    else:
+                        stats = self.env['prompt.sync.engine']._export(records)
+                for key in STAT_KEYS:
+                    metrics.count('rows_%s' % key, stats.get(key, 0))
+        except WorksheetBusy as e:
+            # No es un fallo: el lote se reintenta en cuanto la hoja quede libre
+            _logger.info("Export job %s postponed: %s", self.id, e.args[0])
+            self.write({'state': 'pending', 'next_attempt': fields.Datetime.now() + BUSY_RETRY_DELAY})
+            self.env.ref('sale_order_prompt_extractor.ir_cron_prompt_export_job')._trigger(
+                fields.Datetime.now() + BUSY_RETRY_DELAY)
+            return False
+        except Exception as e:
+            self._handle_error(e)
+            return False
+
+        self.write({
+            'pending_ids': json.dumps(rest),
+            'processed_count': self.processed_count + len(chunk),
+            'attempts': 0,
+            'next_attempt': False,
+            'last_error': False,
+            'rows_unchanged': self.rows_unchanged + stats.get('unchanged', 0),
+            'rows_updated': self.rows_updated + stats.get('updated', 0),
+            'rows_inserted': self.rows_inserted + stats.get('inserted', 0) + stats.get('appended', 0),
+            'rows_removed': self.rows_removed + stats.get('deleted', 0),
+        })
+        if not rest:
+            self.write({'state': 'done', 'date_done': fields.Datetime.now()})
+            _logger.info("Export job %s finished: %d record(s)", self.id, self.processed_count)
+            return False
+        return True
+
+    def _absorb_pending_jobs(self):
+        """Fusiona en este trabajo las peticiones pendientes del mismo modelo.
+
+        Varias peticiones simultáneas sobre selecciones que se solapan acaban en
+        una sola lista sin duplicados, así que cada documento se exporta una vez,
+        sin importar qué usuario las hizo (el acceso se comprobó al encolar).
+        Un id que este trabajo ya exportó se vuelve a añadir: la petición nueva
+        puede deberse a un cambio posterior. Los trabajos bloqueados por otra
+        transacción (p. ej. un ``_enqueue`` en curso) se dejan para la siguiente vez.
+        """
+        self.ensure_one()
+        self.env.cr.execute("""
+            SELECT id FROM prompt_export_job
+             WHERE res_model = %s AND mode = 'upsert' AND state = 'pending' AND id != %s
+             ORDER BY id
+               FOR UPDATE SKIP LOCKED
+        """, [self.res_model, self.id])
+        others = self.browse([row[0] for row in self.env.cr.fetchall()])
+        if not others:
+            return
+        pending = self._get_pending_ids()
+        known = set(pending)
+        for other in others:
+            new_ids = [res_id for res_id in other._get_pending_ids() if res_id not in known]
+            known.update(new_ids)
+            pending.extend(new_ids)
+        self.write({
+            'pending_ids': json.dumps(pending),
+            'record_count': self.processed_count + len(pending),
+        })
+        others.write({'state': 'merged', 'merged_into_id': self.id, 'pending_ids': '[]'})
+        _logger.info("Export job %s absorbed %d pending job(s)", self.id, len(others))
+
+    def _rebuild_chunk(self, records, last):
+        """Escribe las filas de ``records`` a continuación de las del lote anterior.
+
+        El primer lote prepara la hoja (staging nueva o la hoja destino limpia);
+        el último sustituye la hoja destino por la de staging. ``next_row`` se
+        guarda en la misma transacción que el avance, así que reintentar un lote
+        vuelve a escribir exactamente las mismas celdas.
+        """
+        self.ensure_one()
+        connection = self.env['prompt.sheet.connection']
+        engine = self.env['prompt.sync.engine']
+        spec = engine._get_spec(self.res_model)
+        header = spec.header
+        # La hoja destino (y su staging) sólo la escribe este trabajo mientras dure el lote
+        connection._lock_worksheets([self.worksheet_name])
+        sink_target = engine._get_target(self.res_model, self.worksheet_name)
+        # Una hoja mensual que aún no existe se crea vacía y se reconstruye igual que las demás
+        target = connection._get_target_worksheet(sink_target)
+        if not self.next_row:
+            # La columna de huellas queda oculta
+            worksheet = prepare_rebuild(target, header, staging=self.use_staging, hidden_columns=[len(header)],
+                                        formats=sink_target.formats)
+            self.next_row = 2
+        elif self.use_staging:
+            # Sin caché: la staging se recrea en cada reconstrucción (y al reintentar
+            # el primer lote), así que un worksheet guardado puede apuntar a una hoja borrada
+            worksheet = call_with_retry(target.spreadsheet.worksheet, staging_title(self.worksheet_name))
+        else:
+            worksheet = target
+
+        sink = SheetRebuildSink(worksheet, self.next_row)
+        stats = engine._export(records, sink=sink)
+        stats['api_calls'] = sink.stats['api_calls']
+        self.next_row = sink.next_row
+
+        if last:
+            if self.use_staging:
+                swap_worksheets(target, worksheet)
+                # Las hojas en caché apuntan a la hoja eliminada o a la de staging
+                SHEET_CONNECTIONS.clear(self.env.cr.dbname)
+            self.env['prompt.sheet.index']._invalidate(target, spec.key_column)
+            _logger.info("Export job %s rebuilt worksheet '%s' with %d row(s)",
+                         self.id, self.worksheet_name, self.next_row - 2)
+        return stats
+
+    def _handle_error(self, error):
+        """Reintenta con espera exponencial los fallos temporales y los de una hoja sustituida; el resto marca el trabajo como fallido."""
+        message = str(error.args[0]) if isinstance(error, UserError) and error.args else str(error)
+        stale = is_stale_worksheet_error(error)
+        if stale:
+            # Otro proceso sustituyó la hoja por su staging: los handles en caché de
+            # este proceso apuntan a la hoja eliminada y el reintento la reabrirá
+            SHEET_CONNECTIONS.clear(self.env.cr.dbname)
+        if (is_transient_error(error) or stale) and self.attempts + 1 < MAX_ATTEMPTS:
+            delay = 2 ** self.attempts
+            _logger.warning("Export job %s transient error (attempt %d), retrying in %d min: %s",
+                            self.id, self.attempts + 1, delay, message)
+            self.write({
+                'state': 'pending',
+                'attempts': self.attempts + 1,
+                'next_attempt': fields.Datetime.now() + timedelta(minutes=delay),
+                'last_error': message,
+            })
+            return
+        _logger.error("Export job %s failed: %s", self.id, message)
+        self.write({
+            'state': 'failed',
+            'attempts': self.attempts + 1,
+            'last_error': message,
+        })
+
+    # ---------------------------------------------------------------------
+    # Acciones
+    # ---------------------------------------------------------------------
+
+    def action_retry(self):
+        self.filtered(lambda job: job.state == 'failed').write({
+            'state': 'pending',
+            'attempts': 0,
+            'next_attempt': False,
+        })
+        self.env.ref('sale_order_prompt_extractor.ir_cron_prompt_export_job')._trigger()
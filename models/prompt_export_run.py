@@ -0,0 +1,196 @@
+# -*- coding: utf-8 -*-
+
+import json
+import logging
+import os
+import time
+from contextlib import contextmanager
+from datetime import timedelta
+
+from odoo import models, fields, api, _
+
+from ..tools import metrics
+from ..tools.metrics import ExportMetrics, prometheus_text
+
+_logger = logging.getLogger(__name__)
+
+# Tramos con campo propio en la ejecución (el resto sólo queda en el detalle JSON)
+SPAN_FIELDS = {
+    'credentials': 'time_credentials',
+    'worksheet_open': 'time_worksheet_open',
+    'key_column_read': 'time_key_read',
+    'row_building': 'time_row_building',
+    'sheets_read': 'time_sheets_read',
+    'sheets_write': 'time_sheets_write',
+    'rate_limit_wait': 'time_rate_limit',
+}
+COUNTER_FIELDS = {
+    'sql_queries': 'sql_queries',
+    'sheets_requests': 'sheets_requests',
+    'sheets_retries': 'sheets_retries',
+    'bytes_sent': 'bytes_sent',
+}
+ROW_FIELDS = ('rows_unchanged', 'rows_updated', 'rows_inserted', 'rows_deleted', 'rows_appended')
+RUN_RETENTION = timedelta(days=30)
+
+
+class PromptExportRun(models.Model):
+    _name = 'prompt.export.run'
+    _description = 'Google Sheets Export Run'
+    _order = 'id desc'
+
+    name = fields.Char(readonly=True)
+    res_model = fields.Selection([
+        ('sale.order', 'Sale Orders'),
+        ('account.move', 'Invoices'),
+    ], string='Document Type', readonly=True)
+    job_id = fields.Many2one('prompt.export.job', string='Export Job', ondelete='set null', readonly=True)
+    user_id = fields.Many2one('res.users', string='User', readonly=True)
+    state = fields.Selection([
+        ('done', 'Done'),
+        ('failed', 'Failed'),
+    ], required=True, readonly=True)
+    error = fields.Text(readonly=True)
+    date_start = fields.Datetime(readonly=True)
+    duration = fields.Float(string='Duration (s)', readonly=True, digits=(16, 3))
+    record_count = fields.Integer(string='Records', readonly=True)
+
+    rows_unchanged = fields.Integer(readonly=True)
+    rows_updated = fields.Integer(readonly=True)
+    rows_inserted = fields.Integer(readonly=True)
+    rows_deleted = fields.Integer(readonly=True)
+    rows_appended = fields.Integer(readonly=True)
+
+    sql_queries = fields.Integer(string='SQL Queries', readonly=True)
+    sheets_requests = fields.Integer(string='Sheets Requests', readonly=True)
+    sheets_retries = fields.Integer(string='Sheets Retries', readonly=True)
+    bytes_sent = fields.Integer(string='Bytes Sent', readonly=True)
+
+    time_credentials = fields.Float(string='Credentials (s)', readonly=True, digits=(16, 3))
+    time_worksheet_open = fields.Float(string='Worksheet Open (s)', readonly=True, digits=(16, 3))
+    time_key_read = fields.Float(string='Key Column Read (s)', readonly=True, digits=(16, 3))
+    time_row_building = fields.Float(string='Row Building (s)', readonly=True, digits=(16, 3))
+    time_sheets_read = fields.Float(string='Sheets Reads (s)', readonly=True, digits=(16, 3))
+    time_sheets_write = fields.Float(string='Sheets Writes (s)', readonly=True, digits=(16, 3))
+    time_rate_limit = fields.Float(string='Rate Limit Wait (s)', readonly=True, digits=(16, 3))
+    details = fields.Text(readonly=True, help='JSON with every timing span (count, total and max seconds) and counter.')
+
+    # ---------------------------------------------------------------------
+    # Registro de ejecuciones
+    # ---------------------------------------------------------------------
+
+    @contextmanager
+    def _track(self, res_model, record_count, job=None):
+        """Mide la exportación ejecutada dentro del bloque y la guarda como ejecución.
+
+        Dentro del bloque las métricas están activas para todo el código de la
+        exportación; quien llama añade las estadísticas de filas con
+        ``metrics.count('rows_<operación>', n)``. La ejecución se guarda con un
+        cursor propio para conservarla aunque la exportación se revierta.
+        """
+        export_metrics = ExportMetrics()
+        date_start = fields.Datetime.now()
+        start = time.perf_counter()
+        queries = self.env.cr.sql_log_count
+        error = None
+        try:
+            with metrics.collect(export_metrics):
+                yield export_metrics
+        except Exception as e:
+            error = e
+            raise
+        finally:
+            export_metrics.count('sql_queries', self.env.cr.sql_log_count - queries)
+            self._save_run(export_metrics, {
+                'name': '%s (%s)' % (res_model, fields.Datetime.to_string(date_start)),
+                'res_model': res_model,
+                'job_id': job.id if job else False,
+                'user_id': job.user_id.id if job else self.env.uid,
+                'state': 'failed' if error else 'done',
+                'error': str(error) if error else False,
+                'date_start': date_start,
+                'duration': time.perf_counter() - start,
+                'record_count': record_count,
+            })
+
+    @api.model
+    def _save_run(self, export_metrics, values):
+        data = export_metrics.as_dict()
+        for name, field_name in SPAN_FIELDS.items():
+            values[field_name] = export_metrics.span_seconds(name)
+        for name, field_name in COUNTER_FIELDS.items():
+            values[field_name] = data['counters'].get(name, 0)
+        for field_name in ROW_FIELDS:
+            values[field_name] = data['counters'].get(field_name, 0)
+        values['details'] = json.dumps(data, indent=2, sort_keys=True)
+        _logger.info("Export run %s: %.2fs, %d SQL queries, %d Sheets request(s), %d byte(s) sent",
+                     values['name'], values['duration'], values['sql_queries'],
+                     values['sheets_requests'], values['bytes_sent'])
+        try:
+            with self.env.registry.cursor() as cr:
+                Run = self.with_env(self.env(cr=cr, su=True))
+                Run.create(values)
+                Run._dump_prometheus()
+        except Exception:
+            # Las métricas nunca deben hacer fallar una exportación
+            _logger.exception("Could not save export run %s", values['name'])
+
+    @api.autovacuum
+    def _gc_export_runs(self):
+        self.search([('date_start', '<', fields.Datetime.now() - RUN_RETENTION)]).unlink()
+
+    # ---------------------------------------------------------------------
+    # Exposición para Prometheus
+    # ---------------------------------------------------------------------
+
+    @api.model
+    def _prometheus_metrics(self):
+        """Totales de las ejecuciones guardadas en formato de texto de Prometheus."""
+        sums = ['duration', 'record_count', 'sql_queries', 'sheets_requests', 'sheets_retries', 'bytes_sent']
+        sums += list(ROW_FIELDS) + list(SPAN_FIELDS.values())
+        groups = self.sudo()._read_group(
+            [], ['res_model', 'state'], ['__count'] + ['%s:sum' % name for name in sums])
+
+        samples = {name: [] for name in sums + ['runs']}
+        for res_model, state, run_count, *totals in groups:
+            labels = {'model': res_model or '', 'state': state}
+            samples['runs'].append((labels, run_count))
+            for name, total in zip(sums, totals):
+                samples[name].append((labels, total or 0))
+
+        def rows(field_name):
+            return [(dict(labels, operation=field_name[len('rows_'):]), value)
+                    for labels, value in samples[field_name]]
+
+        def spans(span_name):
+            return [(dict(labels, span=span_name), value)
+                    for labels, value in samples[SPAN_FIELDS[span_name]]]
+
+        return prometheus_text([
+            ('prompt_export_runs_total', 'counter', 'Export runs.', samples['runs']),
+            ('prompt_export_duration_seconds_total', 'counter', 'Wall time of export runs.', samples['duration']),
+            ('prompt_export_records_total', 'counter', 'Records exported.', samples['record_count']),
+            ('prompt_export_rows_total', 'counter', 'Rows written by operation.',
+             [sample for field_name in ROW_FIELDS for sample in rows(field_name)]),
+            ('prompt_export_sql_queries_total', 'counter', 'SQL queries issued by exports.', samples['sql_queries']),
+            ('prompt_export_sheets_requests_total', 'counter', 'Google Sheets API requests.',
+             samples['sheets_requests']),
+            ('prompt_export_sheets_retries_total', 'counter', 'Google Sheets API requests retried.',
+             samples['sheets_retries']),
+            ('prompt_export_sheets_bytes_sent_total', 'counter', 'Payload bytes sent to Google Sheets.',
+             samples['bytes_sent']),
+            ('prompt_export_span_seconds_total', 'counter', 'Time spent in each export step.',
+             [sample for span_name in SPAN_FIELDS for sample in spans(span_name)]),
+        ])
+
+    @api.model
+    def _dump_prometheus(self):
+        """Escribe los totales en ``prometheus_file`` (p. ej. para el textfile collector de node_exporter)."""
+        path = self.env['prompt.settings']._get_settings().prometheus_file
+        if not path:
+            return
+        # Escritura atómica: el colector nunca debe leer un archivo a medias
+        tmp_path = '%s.%d.tmp' % (path, os.getpid())
+        with open(tmp_path, 'w', encoding='utf-8') as handle:
+            handle.write(self._prometheus_metrics())
+        os.replace(tmp_path, path)
@@ -0,0 +1,81 @@
+# -*- coding: utf-8 -*-
+
+import logging
+
+from odoo import models, api
+
+from ..tools.rate_cache import RATE_CACHE
+
+_logger = logging.getLogger(__name__)
+
+# Misma regla que res.currency._get_rates: la última tasa hasta la fecha (las
+# de la empresa antes que las globales) y, si no hay, la primera registrada.
+RATES_QUERY = """
+    WITH req(currency_id, company_id, date) AS (VALUES %s)
+    SELECT req.currency_id, req.company_id, req.date,
+           COALESCE(
+               (SELECT r.rate FROM res_currency_rate r
+                 WHERE r.currency_id = req.currency_id AND r.name <= req.date
+                   AND (r.company_id IS NULL OR r.company_id = req.company_id)
+              ORDER BY r.company_id, r.name DESC
+                 LIMIT 1),
+               (SELECT r.rate FROM res_currency_rate r
+                 WHERE r.currency_id = req.currency_id
+                   AND (r.company_id IS NULL OR r.company_id = req.company_id)
+              ORDER BY r.company_id, r.name ASC
+                 LIMIT 1),
+               1.0)
+      FROM req
+"""
+
+
+class PromptRateService(models.AbstractModel):
+    _name = 'prompt.rate.service'
+    _description = 'Exchange Rates for Prompt Extractor Exports'
+
+    @api.model
+    def _get_rates(self, keys):
+        """Tipos de cambio de la moneda a la moneda de la empresa para cada ``(moneda, empresa, fecha)``.
+
+        ``keys`` es un iterable de tuplas de registros ``res.currency`` y
+        ``res.company`` con una fecha; el resultado usa las mismas tuplas como
+        claves, igual que ``res.currency._get_conversion_rate``. Las tasas que
+        no están en la caché del proceso se resuelven con una sola consulta.
+        """
+        keys = set(keys)
+        id_keys = {key: (key[0].id, key[1].id, key[2]) for key in keys}
+        scope = self.env.cr.dbname
+        cached, missing = RATE_CACHE.get_many(scope, set(id_keys.values()))
+        if missing:
+            cached.update(self._compute_rates(missing))
+            RATE_CACHE.update(scope, {key: cached[key] for key in missing})
+        return {key: cached[id_keys[key]] for key in keys}
+
+    @api.model
+    def _compute_rates(self, id_keys):
+        """Resuelve ``(moneda_id, empresa_id, fecha)`` con una consulta a ``res_currency_rate``."""
+        companies = self.env['res.company'].sudo().browse({company_id for _c, company_id, _d in id_keys})
+        company_currency = {company.id: company.currency_id.id for company in companies}
+        root = {company.id: company.root_id.id for company in companies}
+
+        # Tasas frente a la moneda base de cada moneda involucrada y de la de la empresa
+        wanted = set()
+        for currency_id, company_id, date in id_keys:
+            wanted.add((currency_id, root[company_id], date))
+            wanted.add((company_currency[company_id], root[company_id], date))
+
+        self.env['res.currency.rate'].flush_model(['rate', 'currency_id', 'company_id', 'name'])
+        wanted = sorted(wanted)
+        self.env.cr.execute(
+            RATES_QUERY % ', '.join(['(%s, %s, %s::date)'] * len(wanted)),
+            [value for key in wanted for value in key])
+        base_rates = {(currency_id, company_id, date): rate
+                      for currency_id, company_id, date, rate in self.env.cr.fetchall()}
+
+        rates = {}
+        for currency_id, company_id, date in id_keys:
+            from_rate = base_rates[(currency_id, root[company_id], date)]
+            to_rate = base_rates[(company_currency[company_id], root[company_id], date)]
+            rates[(currency_id, company_id, date)] = to_rate / from_rate if from_rate else 0.0
+        _logger.info("Resolved %d exchange rate(s) with one query", len(rates))
+        return rates
@@ -0,0 +1,136 @@
+# -*- coding: utf-8 -*-
+
+from dateutil.relativedelta import relativedelta
+
+from odoo import models, fields, api, _
+from odoo.exceptions import UserError
+
+from ..tools.fingerprint import clear_fingerprints
+
+
+class PromptRebuildWizard(models.TransientModel):
+    _name = 'prompt.rebuild.wizard'
+    _description = 'Rebuild Google Sheets Worksheet'
+
+    res_model = fields.Selection([
+        ('sale.order', 'Sale Orders'),
+        ('account.move', 'Invoices'),
+    ], string='Document Type', required=True, default='sale.order')
+    company_id = fields.Many2one('res.company', required=True, default=lambda self: self.env.company)
+    # Sólo se usan (y se exigen en la vista) con hojas mensuales
+    date_from = fields.Date(default=lambda self: fields.Date.today().replace(day=1))
+    date_to = fields.Date(default=fields.Date.today)
+    use_staging = fields.Boolean(
+        string='Use Staging Worksheet', default=True,
+        help='Write the rows to a temporary worksheet and replace the original one only when all rows '
+             'are written, so readers never see a half-written worksheet.')
+    partitioned = fields.Boolean(compute='_compute_partitioned')
+    worksheet_name = fields.Char(compute='_compute_worksheet_name')
+
+    def _compute_partitioned(self):
+        self.partitioned = self.env['prompt.sync.engine']._is_partitioned()
+
+    @api.depends('res_model', 'company_id', 'date_from', 'date_to')
+    def _compute_worksheet_name(self):
+        engine = self.env['prompt.sync.engine']
+        partitioned = engine._is_partitioned()
+        for wizard in self:
+            if not (wizard.res_model and wizard.company_id):
+                wizard.worksheet_name = False
+            elif partitioned:
+                wizard.worksheet_name = ', '.join(
+                    engine._get_worksheet_name(wizard.res_model, wizard.company_id.name, month)
+                    for month in wizard._get_months())
+            else:
+                wizard.worksheet_name = engine._get_worksheet_name(wizard.res_model, wizard.company_id.name)
+
+    def _get_months(self):
+        """Primer día de cada mes del periodo."""
+        self.ensure_one()
+        months = []
+        if self.date_from and self.date_to:
+            month = self.date_from.replace(day=1)
+            while month <= self.date_to:
+                months.append(month)
+                month += relativedelta(months=1)
+        return months
+
+    def _get_scope_domain(self):
+        """Documentos que caben en las hojas a reconstruir, estén o no en el dominio exportable.
+
+        Cada hoja se reescribe completa, así que incluye a todas las empresas que
+        escriben en la misma hoja que ``company_id`` (p. ej. las que usan la hoja
+        por defecto). Sin hojas mensuales son todos sus documentos, de cualquier
+        fecha; con hojas mensuales, los de los meses completos del periodo (en
+        UTC, como las propias hojas).
+        """
+        self.ensure_one()
+        engine = self.env['prompt.sync.engine']
+        worksheet_name = engine._get_worksheet_name(self.res_model, self.company_id.name)
+        company_ids = [
+            company.id for company in self.env['res.company'].sudo().search([])
+            if engine._get_worksheet_name(self.res_model, company.name) == worksheet_name]
+        domain = [('company_id', 'in', company_ids)]
+        if engine._is_partitioned():
+            date_field = engine._get_spec(self.res_model).date_field
+            months = self._get_months()
+            domain += [
+                (date_field, '>=', months[0]),
+                (date_field, '<', months[-1] + relativedelta(months=1)),
+            ]
+        return domain
+
+    def _get_record_ids(self):
+        """Ids de los documentos de las hojas a reconstruir, en orden de fecha y folio."""
+        self.ensure_one()
+        spec = self.env['prompt.sync.engine']._get_spec(self.res_model)
+        return self.env[self.res_model].sudo().search(
+            self._get_scope_domain() + spec.domain, order='%s, name, id' % spec.date_field).ids
+
+    def action_rebuild(self):
+        self.ensure_one()
+        if self.partitioned:
+            if not (self.date_from and self.date_to):
+                raise UserError(_("Select the period of the monthly worksheets to rebuild."))
+            if self.date_from > self.date_to:
+                raise UserError(_("The start date must be before the end date."))
+        res_ids = self._get_record_ids()
+        if not res_ids:
+            raise UserError(_("There are no documents to export for this worksheet."))
+        engine = self.env['prompt.sync.engine']
+        if engine._is_partitioned():
+            # Un trabajo por hoja mensual, cada uno con sus documentos en el mismo orden
+            worksheet_by_id = {
+                res_id: worksheet_name
+                for worksheet_name, ids in engine.sudo()._group_by_worksheet(
+                    self.res_model, [('id', 'in', res_ids)]).items()
+                for res_id in ids}
+            ids_by_worksheet = {}
+            for res_id in res_ids:
+                ids_by_worksheet.setdefault(worksheet_by_id[res_id], []).append(res_id)
+        else:
+            ids_by_worksheet = {self.worksheet_name: res_ids}
+
+        # Las filas de los documentos que ya no se exportan (cancelados, borradores)
+        # desaparecen de la hoja: sin huella, se volverán a escribir si regresan
+        clear_fingerprints(self.env[self.res_model].sudo().search(
+            self._get_scope_domain() + [('id', 'not in', res_ids), ('prompt_fingerprint', '!=', False)]))
+
+        Job = self.env['prompt.export.job']
+        jobs = Job
+        for worksheet_name, ids in sorted(ids_by_worksheet.items()):
+            jobs |= Job._enqueue_rebuild(self.res_model, ids, worksheet_name, self.use_staging)
+        return {
+            'type': 'ir.actions.client',
+            'tag': 'display_notification',
+            'params': {
+                'title': _('Rebuild Queued'),
+                'message': _('Worksheet %(sheet)s will be rebuilt with %(count)s document(s) (job %(job)s).') % {
+                    'sheet': ', '.join(sorted(ids_by_worksheet)),
+                    'count': len(res_ids),
+                    'job': ', '.join(jobs.mapped('name')),
+                },
+                'sticky': False,
+                'next': {'type': 'ir.actions.act_window_close'},
+            }
+        }
@@ -0,0 +1,198 @@
+# -*- coding: utf-8 -*-
+
+import logging
+import re
+
+from odoo import models, fields, api, _
+from odoo.exceptions import UserError
+
+from ..tools.fingerprint import FINGERPRINT_COLUMN, clear_fingerprints
+from ..tools.reconcile import Reconciliation, delete_row_blocks, read_key_columns
+
+_logger = logging.getLogger(__name__)
+
+
+class PromptReconcileWizard(models.TransientModel):
+    _name = 'prompt.reconcile.wizard'
+    _description = 'Reconcile Google Sheets with Odoo'
+
+    state = fields.Selection([('draft', 'Draft'), ('scanned', 'Scanned')], default='draft')
+    report = fields.Text(readonly=True)
+    orphan_count = fields.Integer(string='Orphan Folios', readonly=True,
+                                  help='Folios in the worksheet that do not match any exported document.')
+    duplicate_count = fields.Integer(string='Duplicated Folios', readonly=True,
+                                     help='Folios that appear in more than one block of rows.')
+    missing_count = fields.Integer(string='Missing Documents', readonly=True,
+                                   help='Confirmed orders or posted invoices that are not in their worksheet.')
+    stale_count = fields.Integer(string='Outdated Documents', readonly=True,
+                                 help='Documents whose rows in the worksheet differ from the last export.')
+
+    # ---------------------------------------------------------------------
+    # Escaneo
+    # ---------------------------------------------------------------------
+
+    @api.model
+    def _get_sheet_by_company(self, res_model):
+        engine = self.env['prompt.sync.engine']
+        return {company.id: engine._get_worksheet_name(res_model, company.name)
+                for company in self.env['res.company'].sudo().search([])}
+
+    @api.model
+    def _get_sheet_models(self, titles=None):
+        """``{hoja: [modelos]}`` de todas las hojas mapeadas.
+
+        Con hojas mensuales son las de los meses que tienen documentos más las
+        que ya existen en la spreadsheet (``titles``; se leen si no se indican),
+        p. ej. un mes cuyos documentos se cancelaron.
+        """
+        engine = self.env['prompt.sync.engine']
+        partitioned = engine._is_partitioned()
+        if partitioned and titles is None:
+            titles = self.env['prompt.sheet.connection']._get_worksheet_titles()
+        sheet_models = {}
+        for res_model, _label in self.env['prompt.export.job']._fields['res_model'].selection:
+            sheet_by_company = self._get_sheet_by_company(res_model)
+            sheets = set(sheet_by_company.values())
+            if partitioned:
+                pattern = re.compile(r'(?:%s) \d{4}-\d{2}$' % '|'.join(map(re.escape, sorted(sheets))))
+                sheets = {title for title in titles if pattern.match(title)}
+                sheets.update(engine.sudo()._group_by_worksheet(
+                    res_model, engine._get_spec(res_model).domain + [('company_id', 'in', list(sheet_by_company))]))
+            for sheet in sheets:
+                sheet_models.setdefault(sheet, []).append(res_model)
+        return sheet_models
+
+    @api.model
+    def _get_records_by_worksheet(self, res_model):
+        """``{hoja: {folio: (id, huella)}}`` de los documentos de ``res_model`` en una sola consulta."""
+        engine = self.env['prompt.sync.engine']
+        spec = engine._get_spec(res_model)
+        partitioned = engine._is_partitioned()
+        sheet_by_company = self._get_sheet_by_company(res_model)
+        company_names = {company.id: company.name for company in self.env['res.company'].sudo().search([])}
+        records = {} if partitioned else {sheet: {} for sheet in sheet_by_company.values()}
+        sheet_by_period = {}
+        for values in self.env[res_model].sudo().search_read(
+                spec.domain + [('company_id', 'in', list(sheet_by_company))],
+                ['name', 'company_id', 'prompt_fingerprint'] + ([spec.date_field] if partitioned else []), load=None):
+            if partitioned:
+                period = values[spec.date_field]
+                key = (values['company_id'], period and (period.year, period.month))
+                if key not in sheet_by_period:
+                    sheet_by_period[key] = engine._get_worksheet_name(
+                        res_model, company_names[values['company_id']], period)
+                sheet = sheet_by_period[key]
+            else:
+                sheet = sheet_by_company[values['company_id']]
+            records.setdefault(sheet, {}).setdefault(
+                values['name'], (values['id'], values['prompt_fingerprint'] or ''))
+        return records
+
+    @api.model
+    def _scan(self):
+        """Cruza todas las hojas mapeadas con Odoo; devuelve ``(conciliaciones, avisos)``."""
+        engine = self.env['prompt.sync.engine']
+        connection = self.env['prompt.sheet.connection']
+        partitioned = engine._is_partitioned()
+        titles = set(connection._get_worksheet_titles())
+        warnings = []
+        targets = []
+        for sheet, sheet_res_models in sorted(self._get_sheet_models(titles).items()):
+            if len(sheet_res_models) > 1:
+                # Columnas distintas en la misma hoja: no se puede saber qué fila es de quién
+                warnings.append(_("%s: skipped, it receives more than one document type.", sheet))
+                continue
+            if sheet not in titles and not partitioned:
+                warnings.append(_("%s: skipped, the worksheet does not exist in the spreadsheet.", sheet))
+                continue
+            res_model = sheet_res_models[0]
+            header = engine._get_spec(res_model).header
+            targets.append((sheet, res_model, header.index(FINGERPRINT_COLUMN) + 1))
+        if not targets:
+            return [], warnings
+
+        records_by_model = {
+            res_model: self._get_records_by_worksheet(res_model)
+            for res_model in {res_model for sheet, res_model, fp_column in targets}}
+        # Una hoja mensual que aún no existe se concilia como vacía: todos sus documentos faltan
+        columns = read_key_columns(connection._get_spreadsheet(), [
+            (sheet, engine._get_spec(res_model).key_column, fp_column)
+            for sheet, res_model, fp_column in targets if sheet in titles])
+        reconciliations = [
+            Reconciliation(sheet, res_model, *columns.get(sheet, ([], [])), records_by_model[res_model].get(sheet, {}))
+            for sheet, res_model, fp_column in targets]
+        return reconciliations, warnings
+
+    def _store_report(self, reconciliations, warnings, header=None):
+        lines = [header] if header else []
+        for reconciliation in reconciliations:
+            lines.extend(reconciliation.report_lines())
+        lines.extend(warnings)
+        self.write({
+            'state': 'scanned',
+            'report': '\n'.join(lines),
+            'orphan_count': sum(len(r.orphans) for r in reconciliations),
+            'duplicate_count': sum(len(r.duplicates) for r in reconciliations),
+            'missing_count': sum(len(r.missing) for r in reconciliations),
+            'stale_count': sum(len(r.stale) for r in reconciliations),
+        })
+
+    def _reopen(self):
+        return {
+            'type': 'ir.actions.act_window',
+            'res_model': self._name,
+            'res_id': self.id,
+            'view_mode': 'form',
+            'target': 'new',
+        }
+
+    # ---------------------------------------------------------------------
+    # Acciones
+    # ---------------------------------------------------------------------
+
+    def action_scan(self):
+        self.ensure_one()
+        reconciliations, warnings = self._scan()
+        self._store_report(reconciliations, warnings)
+        return self._reopen()
+
+    def action_fix(self):
+        """Elimina los bloques huérfanos y repetidos y encola los documentos faltantes.
+
+        Las hojas se reservan y se vuelven a escanear justo antes: las filas a
+        eliminar se calculan sobre su contenido actual, no sobre el del informe.
+        """
+        self.ensure_one()
+        connection = self.env['prompt.sheet.connection']
+        engine = self.env['prompt.sync.engine']
+        # Ninguna exportación puede escribir entre el escaneo y la eliminación
+        connection._lock_worksheets(self._get_sheet_models())
+        reconciliations, warnings = self._scan()
+        deleted = queued = 0
+        for reconciliation in reconciliations:
+            if not reconciliation.has_drift:
+                continue
+            blocks = reconciliation.rows_to_delete()
+            if blocks:
+                worksheet = connection._get_worksheet(reconciliation.title)
+                try:
+                    delete_row_blocks(worksheet, blocks)
+                finally:
+                    self.env['prompt.sheet.index']._invalidate(
+                        worksheet, engine._get_spec(reconciliation.res_model).key_column)
+                deleted += sum(last - first + 1 for first, last in blocks)
+            res_ids = reconciliation.ids_to_export()
+            if res_ids:
+                # Con la huella guardada la exportación los omitiría: sus filas
+                # en Odoo no cambiaron, lo que falta o difiere es la hoja
+                clear_fingerprints(self.env[reconciliation.res_model].sudo().browse(res_ids))
+                # Son documentos de la hoja, de cualquier empresa que la use
+                self.env['prompt.export.job'].sudo()._enqueue(reconciliation.res_model, res_ids)
+                queued += len(res_ids)
+        if not (deleted or queued):
+            raise UserError(_("The worksheets already match Odoo, there is nothing to fix."))
+        _logger.info("Reconciliation removed %d row(s) and queued %d document(s)", deleted, queued)
+        self._store_report(reconciliations, warnings, header=_(
+            "Removed %(rows)s row(s) and queued %(count)s document(s) for export. State before the fix:",
+            rows=deleted, count=queued))
+        return self._reopen()
@@ -0,0 +1,99 @@
+# -*- coding: utf-8 -*-
+
+import json
+import logging
+from collections import namedtuple
+from types import MappingProxyType
+
+from odoo import models, api, tools
+
+_logger = logging.getLogger(__name__)
+
+PARAM_PREFIX = 'sale_order_prompt_extractor.'
+
+# Valores por defecto de los parámetros numéricos
+INT_DEFAULTS = {
+    'export_chunk_size': 200,
+    'stream_batch_size': 500,
+    'sheets_max_workers': 4,
+    'sheets_requests_per_minute': 60,
+}
+# Campos que una llave de service account debe tener
+SERVICE_ACCOUNT_FIELDS = ('client_email', 'private_key')
+
+# Configuración ya interpretada; se comparte entre peticiones, no modificar
+PromptSettings = namedtuple('PromptSettings', [
+    'sheet_url', 'service_account_key', 'default_worksheet', 'auto_sync', 'partition_by_month',
+    'prometheus_file',
+] + list(INT_DEFAULTS))
+
+
+def parse_mapping(value):
+    """Interpreta un mapeo JSON ``{"Empresa": "Hoja"}``; lanza ``ValueError`` si no es válido."""
+    if not value:
+        return {}
+    mapping = json.loads(value)
+    if not isinstance(mapping, dict) or not all(
+            isinstance(key, str) and isinstance(sheet, str) and sheet.strip()
+            for key, sheet in mapping.items()):
+        raise ValueError('expected a JSON object of company names to worksheet names')
+    return mapping
+
+
+def parse_service_account_key(value):
+    """Interpreta la llave JSON de la service account; lanza ``ValueError`` si no es válida."""
+    info = json.loads(value)
+    if not isinstance(info, dict):
+        raise ValueError('expected a JSON object')
+    missing = [name for name in SERVICE_ACCOUNT_FIELDS if not info.get(name)]
+    if missing:
+        raise ValueError('missing %s' % ', '.join(missing))
+    return info
+
+
+def parse_int(value, default):
+    try:
+        return max(1, int(value))
+    except (TypeError, ValueError):
+        return default
+
+
+class PromptSettingsAccessor(models.AbstractModel):
+    """Acceso tipado y en caché a los parámetros del módulo.
+
+    Los parámetros se leen e interpretan una vez por proceso. ``ir.config_parameter``
+    vacía la caché del registro al crear, modificar o borrar cualquier parámetro,
+    así que un cambio en Ajustes (o en Parámetros del sistema) se ve en la
+    siguiente llamada de todos los workers.
+    """
+    _name = 'prompt.settings'
+    _description = 'Prompt Extractor Settings Accessor'
+
+    @api.model
+    @tools.ormcache()
+    def _get_settings(self):
+        param = self.env['ir.config_parameter'].sudo()
+
+        def get(name, default=None):
+            return param.get_param(PARAM_PREFIX + name, default)
+
+        return PromptSettings(
+            sheet_url=get('google_sheet_url') or None,
+            service_account_key=get('google_service_account_key') or None,
+            default_worksheet=get('google_sheet_worksheet_name') or None,
+            auto_sync=bool(get('auto_sync')),
+            partition_by_month=bool(get('partition_by_month')),
+            prometheus_file=get('prometheus_file') or None,
+            **{name: parse_int(get(name), default) for name, default in INT_DEFAULTS.items()}
+        )
+
+    @api.model
+    @tools.ormcache('param_name')
+    def _get_company_mapping(self, param_name):
+        """Mapeo empresa -> hoja del parámetro ``param_name`` (vacío si no es válido)."""
+        value = self.env['ir.config_parameter'].sudo().get_param(param_name)
+        try:
+            return MappingProxyType(parse_mapping(value))
+        except ValueError as e:
+            _logger.warning("Invalid JSON in company mapping '%s', using default worksheet: %s", param_name, e)
+            return MappingProxyType({})
@@ -0,0 +1,135 @@
+# -*- coding: utf-8 -*-
+
+import json
+import logging
+from datetime import timedelta
+
+from odoo import models, fields, api, _
+
+from ..tools import metrics
+from ..tools.retry import StaleWorksheet, call_with_retry
+
+_logger = logging.getLogger(__name__)
+
+# Aunque el número de filas coincida, el índice se reconstruye pasado este
+# tiempo para recoger ediciones manuales que no añaden ni quitan filas.
+MAX_INDEX_AGE = timedelta(hours=1)
+
+
+class PromptSheetIndex(models.Model):
+    _name = 'prompt.sheet.index'
+    _description = 'Google Sheets Key Column Index'
+
+    sheet_key = fields.Char(required=True, index=True, readonly=True,
+                            help='Spreadsheet id and worksheet id the index belongs to.')
+    worksheet_name = fields.Char(readonly=True)
+    key_column = fields.Integer(required=True, readonly=True)
+    row_count = fields.Integer(readonly=True, help='Grid row count of the worksheet when the index was saved.')
+    key_count = fields.Integer(readonly=True)
+    keys = fields.Text(readonly=True, help='JSON list with the key column values, one per row.')
+    date_built = fields.Datetime(readonly=True)
+
+    _sql_constraints = [
+        ('sheet_key_column_uniq', 'unique(sheet_key, key_column)',
+         'There can only be one index per worksheet and key column.'),
+    ]
+
+    @api.model
+    def _sheet_key(self, worksheet):
+        return '%s:%s' % (worksheet.spreadsheet.id, worksheet.id)
+
+    @api.model
+    def _get_row_count(self, worksheet):
+        """Número de filas de la rejilla (una llamada de metadatos, sin leer celdas).
+
+        Lanza :class:`StaleWorksheet` si el id del handle ya no existe: otro
+        proceso sustituyó la hoja por su staging y el handle en caché apunta a
+        la hoja eliminada.
+        """
+        metadata = call_with_retry(worksheet.spreadsheet.fetch_sheet_metadata, {'fields': 'sheets.properties'})
+        for sheet in metadata.get('sheets', []):
+            properties = sheet.get('properties', {})
+            if properties.get('sheetId') == worksheet.id:
+                return properties.get('gridProperties', {}).get('rowCount', 0)
+        raise StaleWorksheet(worksheet.title)
+
+    # ---------------------------------------------------------------------
+    # Lectura y actualización
+    # ---------------------------------------------------------------------
+
+    @api.model
+    def _get_keys(self, worksheet, key_column, force=False):
+        """Devuelve la columna de claves de la hoja.
+
+        Se usa el índice guardado si el número de filas de la hoja no cambió y no
+        ha caducado; en otro caso se descarga la columna y se guarda de nuevo.
+        El índice se lee con un cursor propio para ver siempre la última versión
+        guardada por ``_store_keys``, aunque sea de esta misma exportación.
+        """
+        with metrics.span('key_column_read'):
+            row_count = self._get_row_count(worksheet)
+            if not force:
+                with self.env.registry.cursor() as cr:
+                    index = self.with_env(self.env(cr=cr, su=True)).search([
+                        ('sheet_key', '=', self._sheet_key(worksheet)),
+                        ('key_column', '=', key_column),
+                    ], limit=1)
+                    if (index and index.row_count == row_count
+                            and index.date_built > fields.Datetime.now() - MAX_INDEX_AGE):
+                        _logger.info("Using stored key index for worksheet '%s' (%d keys)",
+                                     worksheet.title, index.key_count)
+                        return json.loads(index.keys or '[]')
+
+            _logger.info("Rebuilding key index for worksheet '%s'", worksheet.title)
+            keys = call_with_retry(worksheet.col_values, key_column)
+            self._store_keys(worksheet, key_column, keys, row_count)
+            return keys
+
+    @api.model
+    def _store_keys(self, worksheet, key_column, keys, row_count=None):
+        """Guarda la columna de claves en una transacción propia.
+
+        La hoja no participa de la transacción de Odoo: si la exportación se
+        revierte después de escribir, el índice debe seguir reflejando la hoja.
+        """
+        if row_count is None:
+            row_count = self._get_row_count(worksheet)
+        values = {
+            'worksheet_name': worksheet.title,
+            'row_count': row_count,
+            'key_count': len(keys),
+            'keys': json.dumps(keys),
+            'date_built': fields.Datetime.now(),
+        }
+        with self.env.registry.cursor() as cr:
+            Index = self.with_env(self.env(cr=cr, su=True))
+            index = Index.search([
+                ('sheet_key', '=', self._sheet_key(worksheet)),
+                ('key_column', '=', key_column),
+            ], limit=1)
+            if index:
+                index.write(values)
+            else:
+                Index.create(dict(values, sheet_key=self._sheet_key(worksheet), key_column=key_column))
+
+    @api.model
+    def _invalidate(self, worksheet, key_column):
+        """Descarta el índice (p. ej. si una escritura quedó a medias)."""
+        with self.env.registry.cursor() as cr:
+            self.with_env(self.env(cr=cr, su=True)).search([
+                ('sheet_key', '=', self._sheet_key(worksheet)),
+                ('key_column', '=', key_column),
+            ]).unlink()
+
+    @api.model
+    def _execute_plan(self, plan, key_column):
+        """Ejecuta ``plan`` y deja el índice de la hoja al día con el resultado."""
+        final_keys = plan.final_keys()
+        try:
+            stats = plan.execute()
+        except Exception:
+            self._invalidate(plan.worksheet, key_column)
+            raise
+        if plan.has_changes:
+            self._store_keys(plan.worksheet, key_column, final_keys)
+        return stats
@@ -0,0 +1,202 @@
+# -*- coding: utf-8 -*-
+
+import logging
+import re
+from collections import namedtuple
+
+from odoo import models, api
+from odoo.tools import split_every
+
+from ..tools.fingerprint import FingerprintTracker, store_fingerprints
+from ..tools.metrics import timed
+from ..tools.row_format import column_formats
+from ..tools.sinks import STAT_KEYS, SinkTarget
+
+_logger = logging.getLogger(__name__)
+
+CURRENCY_NAMES = {'MXN': 'Peso Mexicano', 'USD': 'Dólar Americano'}
+# Sufijo de las hojas particionadas por mes: "PED G 2026-10"
+PERIOD_FORMAT = '%Y-%m'
+
+# Descripción declarativa de un tipo de documento exportable:
+#
+# - ``header``, ``key_column`` (1-based) y ``diff``: forma de la hoja destino.
+# - ``column_formats``: ``{columna: ColumnFormat}`` de las columnas que no son
+#   texto (ver ``tools.row_format``).
+# - ``prepare`` / ``build_rows``: métodos del modelo que precargan los datos de
+#   un lote y construyen las filas (tuplas de valores crudos) de un registro.
+# - ``mapping_param`` / ``default_worksheet``: hoja de cada empresa.
+# - ``export_domain``: filtro de los registros que se exportan.
+# - ``domain``, ``line_model``, ``line_field``, ``date_field``: qué documentos
+#   sincroniza el cron incremental y reconstruye el asistente; ``date_field``
+#   decide además la hoja mensual de cada documento.
+ExportSpec = namedtuple('ExportSpec', [
+    'header', 'key_column', 'diff', 'column_formats', 'prepare', 'build_rows',
+    'mapping_param', 'default_worksheet', 'export_domain',
+    'domain', 'line_model', 'line_field', 'date_field',
+])
+
+
+class PromptSyncEngine(models.AbstractModel):
+    """Motor común de exportación a Google Sheets.
+
+    Cada modelo exportable declara su ``ExportSpec`` en ``_prompt_export_spec``;
+    el agrupado por empresa, los lotes, las huellas y la escritura en el sink
+    viven sólo aquí.
+    """
+    _name = 'prompt.sync.engine'
+    _description = 'Google Sheets Sync Engine for Prompt Extractor'
+
+    @api.model
+    def _get_spec(self, res_model):
+        return self.env[res_model]._prompt_export_spec
+
+    # ---------------------------------------------------------------------
+    # Hoja destino
+    # ---------------------------------------------------------------------
+
+    @api.model
+    def _get_worksheet_name(self, res_model, company_name, period=None):
+        """Hoja de ``company_name`` según el mapeo JSON del tipo de documento.
+
+        Con ``period`` (una fecha) se devuelve la hoja de ese mes: ``"PED G 2026-10"``.
+        """
+        spec = self._get_spec(res_model)
+        settings = self.env['prompt.settings']
+        default_worksheet = settings._get_settings().default_worksheet or spec.default_worksheet
+        worksheet_name = default_worksheet
+        if company_name:
+            worksheet_name = settings._get_company_mapping(spec.mapping_param).get(company_name, default_worksheet)
+        if period:
+            return '%s %s' % (worksheet_name, period.strftime(PERIOD_FORMAT))
+        return worksheet_name
+
+    @api.model
+    def _is_partitioned(self):
+        return self.env['prompt.settings']._get_settings().partition_by_month
+
+    @api.model
+    def _get_record_worksheet_name(self, record, partitioned):
+        """Hoja de ``record``: la de su empresa o, con ``partitioned``, la de su empresa y mes."""
+        # Las fechas y horas se toman en UTC, igual que en las filas
+        period = record[self._get_spec(record._name).date_field] if partitioned else None
+        return self._get_worksheet_name(record._name, record.company_id.name, period)
+
+    @api.model
+    def _group_by_worksheet(self, res_model, domain):
+        """``{hoja: ids}`` de los documentos de ``res_model`` que cumplen ``domain``, en una sola consulta."""
+        spec = self._get_spec(res_model)
+        groupby = ['company_id']
+        if self._is_partitioned():
+            groupby.append('%s:month' % spec.date_field)
+        ids_by_worksheet = {}
+        groups = self.env[res_model].with_context(tz='UTC')._read_group(domain, groupby, ['id:array_agg'])
+        for company, *period, ids in groups:
+            worksheet_name = self._get_worksheet_name(res_model, company.name, period[0] if period else None)
+            ids_by_worksheet.setdefault(worksheet_name, []).extend(ids)
+        return ids_by_worksheet
+
+    @api.model
+    def _get_target(self, res_model, worksheet_name):
+        spec = self._get_spec(res_model)
+        return SinkTarget(worksheet_name, spec.key_column, spec.header, spec.diff,
+                          column_formats(spec.header, spec.column_formats))
+
+    # ---------------------------------------------------------------------
+    # Utilidades para los constructores de filas
+    # ---------------------------------------------------------------------
+
+    @api.model
+    def _get_dias_credito(self, payment_term):
+        if not payment_term:
+            return "VERIFICAR"
+        name = payment_term.name.lower()
+        if "inmediato" in name or "immediate" in name or "contado" in name:
+            return 0
+        numbers = re.findall(r'\d+', name)
+        return int(numbers[0]) if numbers else "VERIFICAR"
+
+    @api.model
+    def _get_tipo_credito(self, dias_credito):
+        if isinstance(dias_credito, int):
+            return "CRÉDITO" if dias_credito > 0 else "CONTADO"
+        return "VERIFICAR"
+
+    @api.model
+    def _get_currency_label(self, currency, default=""):
+        return CURRENCY_NAMES.get(currency.name, currency.name or default)
+
+    # ---------------------------------------------------------------------
+    # Exportación
+    # ---------------------------------------------------------------------
+
+    @api.model
+    def _export(self, records, sink=None):
+        """Exporta ``records`` y devuelve el total de filas por operación.
+
+        Las filas se entregan a ``sink`` (por defecto Google Sheets):
+
+        - Si el folio ya existe, sus filas se reescriben en la MISMA posición;
+          con ``diff`` sólo se reescriben las celdas que cambiaron.
+        - Si hay menos filas nuevas que antiguas, las sobrantes se eliminan.
+        - Si el folio no existe, sus filas se añaden al final.
+        - Los documentos se agrupan por empresa para usar la hoja de cada una;
+          con hojas mensuales, por empresa y mes, y cada documento sólo se busca
+          en la hoja de su mes (que se crea si aún no existe).
+
+        Los registros se procesan en lotes de tamaño fijo y las filas se generan
+        bajo demanda, por lo que la memoria no crece con la selección.
+        """
+        spec = self._get_spec(records._name)
+        totals = dict.fromkeys(STAT_KEYS, 0)
+        connection = self.env['prompt.sheet.connection']
+        own_sink = sink is None
+        if own_sink:
+            sink = connection._get_sheet_sink()
+        fingerprints = FingerprintTracker(sink.skip_unchanged)
+
+        try:
+            if sink.tracks_fingerprints:
+                # El sink escribe en Google Sheets: una sola transacción por hoja a la vez
+                connection._lock_worksheets(self._group_by_worksheet(records._name, [('id', 'in', records.ids)]))
+            partitioned = self._is_partitioned()
+            for batch_ids in split_every(connection._get_stream_batch_size(), records.ids):
+                # Cada lote tiene su propio conjunto de prefetch
+                batch = records.browse(batch_ids)
+                if spec.export_domain:
+                    batch = batch.filtered_domain(spec.export_domain)
+
+                records_by_worksheet = {}
+                for record in batch:
+                    records_by_worksheet.setdefault(
+                        self._get_record_worksheet_name(record, partitioned), []).append(record)
+                _logger.info("Processing %d %s record(s) for worksheets: %s",
+                             len(batch), records._name, list(records_by_worksheet))
+
+                # Datos compartidos (facturas, tipos de cambio, productos) en lote
+                export_data = timed('row_building', getattr(batch, spec.prepare))
+
+                def build_rows(record):
+                    return timed('row_building', getattr(record, spec.build_rows), export_data)
+
+                for worksheet_name, worksheet_records in records_by_worksheet.items():
+                    target = self._get_target(records._name, worksheet_name)
+                    _logger.info("Processing %d record(s) in worksheet '%s'", len(worksheet_records), target.name)
+                    stats = sink.write_blocks(target, fingerprints.blocks(target, worksheet_records, build_rows))
+                    for key in totals:
+                        totals[key] += stats.get(key, 0)
+
+                # Liberar la caché del ORM antes del siguiente lote
+                self.env.invalidate_all()
+        except Exception:
+            if own_sink:
+                sink.abort()
+            raise
+
+        if own_sink:
+            # Con escritura en paralelo los totales sólo se conocen al cerrar el sink
+            totals = dict(sink.close())
+        if sink.tracks_fingerprints:
+            store_fingerprints(records, fingerprints.written)
+        totals['unchanged'] += fingerprints.skipped_rows
+        return totals
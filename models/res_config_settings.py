@@ -1,5 +1,8 @@
 # -*- coding: utf-8 -*-
-from odoo import models, fields, api
+from odoo import models, fields, api, _
+from odoo.exceptions import ValidationError
+
+from .prompt_settings import INT_DEFAULTS, parse_mapping, parse_service_account_key
 
 class ResConfigSettings(models.TransientModel):
     _inherit = 'res.config.settings'
@@ -35,4 +38,82 @@ class ResConfigSettings(models.TransientModel):
     google_service_account_key = fields.Char(
         string='Google Service Account JSON Key',
         config_parameter='sale_order_prompt_extractor.google_service_account_key'
-    ) 
\ No newline at end of file
+    ) 
+    
+    # Tamaño de lote del cron de exportación
+    export_chunk_size = fields.Integer(
+        string='Export Batch Size',
+        config_parameter='sale_order_prompt_extractor.export_chunk_size',
+        default=200,
+        help='Number of records exported per batch by the background export job.'
+    )
+    
+    # Sincronización incremental automática
+    auto_sync = fields.Boolean(
+        string='Automatic Incremental Sync',
+        config_parameter='sale_order_prompt_extractor.auto_sync',
+        help='Periodically export confirmed sale orders and posted invoices changed since the last run.'
+    )
+    
+    # Una hoja por empresa y mes
+    partition_by_month = fields.Boolean(
+        string='Monthly Worksheets',
+        config_parameter='sale_order_prompt_extractor.partition_by_month',
+        help='Write each document to a worksheet of its company and month (e.g. "PED G 2026-10") '
+             'instead of a single worksheet per company. Missing worksheets are created automatically.'
+    )
+
+    # Tamaño de lote de lectura / escritura dentro de una exportación
+    stream_batch_size = fields.Integer(
+        string='Export Stream Batch Size',
+        config_parameter='sale_order_prompt_extractor.stream_batch_size',
+        default=500,
+        help='Number of records read, converted to rows and flushed to the destination at a time.'
+    )
+    
+    # Escritura en paralelo y cuota de la API de Google Sheets
+    sheets_max_workers = fields.Integer(
+        string='Google Sheets Parallel Writers',
+        config_parameter='sale_order_prompt_extractor.sheets_max_workers',
+        default=4,
+        help='Number of worksheets written at the same time. Use 1 to write them one after another.'
+    )
+    sheets_requests_per_minute = fields.Integer(
+        string='Google Sheets Requests per Minute',
+        config_parameter='sale_order_prompt_extractor.sheets_requests_per_minute',
+        default=60,
+        help='Maximum number of Google Sheets API requests per minute shared by all parallel writers.'
+    )
+    
+    # Volcado de métricas para Prometheus
+    prometheus_file = fields.Char(
+        string='Prometheus Metrics File',
+        config_parameter='sale_order_prompt_extractor.prometheus_file',
+        help='If set, export run totals are written to this file in Prometheus text format after every run.'
+    )
+
+    # Los valores se validan al guardar, no en cada exportación
+    @api.constrains('company_sheet_mapping', 'company_invoice_mapping')
+    def _check_company_mappings(self):
+        for settings in self:
+            for field_name in ('company_sheet_mapping', 'company_invoice_mapping'):
+                try:
+                    parse_mapping(settings[field_name])
+                except ValueError as e:
+                    raise ValidationError(_("%(field)s is not valid: %(error)s",
+                                            field=self._fields[field_name].string, error=e))
+
+    @api.constrains('google_service_account_key')
+    def _check_google_service_account_key(self):
+        for settings in self.filtered('google_service_account_key'):
+            try:
+                parse_service_account_key(settings.google_service_account_key)
+            except ValueError as e:
+                raise ValidationError(_("The Google Service Account Key is not valid: %s", e))
+
+    @api.constrains(*INT_DEFAULTS)
+    def _check_positive_numbers(self):
+        for settings in self:
+            for field_name in INT_DEFAULTS:
+                if settings[field_name] < 1:
+                    raise ValidationError(_("%s must be at least 1.", self._fields[field_name].string))
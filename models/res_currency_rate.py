@@ -0,0 +1,24 @@
+# -*- coding: utf-8 -*-
+
+from odoo import models, api
+
+from ..tools.rate_cache import RATE_CACHE
+
+
+class ResCurrencyRate(models.Model):
+    _inherit = 'res.currency.rate'
+
+    # Cualquier cambio de tasas invalida los tipos de cambio en caché de las exportaciones
+
+    @api.model_create_multi
+    def create(self, vals_list):
+        RATE_CACHE.clear(self.env.cr.dbname)
+        return super().create(vals_list)
+
+    def write(self, vals):
+        RATE_CACHE.clear(self.env.cr.dbname)
+        return super().write(vals)
+
+    def unlink(self):
+        RATE_CACHE.clear(self.env.cr.dbname)
+        return super().unlink()
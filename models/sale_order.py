@@ -1,232 +1,167 @@
 # -*- coding: utf-8 -*-
 
 import logging
-import re
-import json
-
-try:
-    import gspread
-    from google.oauth2.service_account import Credentials
-except ImportError:
-    gspread = None
 
 from odoo import models, fields, api, _
-from odoo.exceptions import UserError
+
+from ..tools.fingerprint import FINGERPRINT_COLUMN
+from ..tools.row_format import DATE_ISO, DECIMAL, INTEGER, QUANTITY, RATE
+from .prompt_sync_engine import ExportSpec
 
 _logger = logging.getLogger(__name__)
 
+# Columnas de la hoja de pedidos (A:W); la clave es la columna D (Pedido Interno)
+ORDER_HEADER = [
+    'Factura', 'Mes', 'Fecha', 'Pedido Interno', 'OC Cliente', 'Domicilio', 'Cliente',
+    'Código Producto', 'Concepto', 'Cantidad', 'Unidad', 'Precio Unitario', 'Subtotal',
+    'Impuestos', 'Total', 'Moneda', 'Tipo Cambio', 'Total MXN', 'Días Crédito',
+    'Tipo Crédito', 'Categoría', 'Familia', 'Estado', FINGERPRINT_COLUMN,
+]
+ORDER_KEY_COLUMN = 4
+ORDER_COLUMN_FORMATS = {
+    'Mes': INTEGER, 'Fecha': DATE_ISO, 'Cantidad': QUANTITY,
+    'Precio Unitario': DECIMAL, 'Subtotal': DECIMAL, 'Impuestos': DECIMAL, 'Total': DECIMAL,
+    'Tipo Cambio': RATE, 'Total MXN': DECIMAL, 'Días Crédito': INTEGER,
+}
+
+ORDER_EXPORT_SPEC = ExportSpec(
+    header=ORDER_HEADER,
+    key_column=ORDER_KEY_COLUMN,
+    diff=False,
+    column_formats=ORDER_COLUMN_FORMATS,
+    prepare='_prepare_prompt_export_data',
+    build_rows='_get_prompt_rows',
+    mapping_param='sale_order_prompt_extractor.company_sheet_mapping',
+    default_worksheet='PED G',
+    export_domain=[],
+    domain=[('state', '=', 'sale')],
+    line_model='sale.order.line',
+    line_field='order_id',
+    date_field='date_order',
+)
+
+
 class SaleOrder(models.Model):
     _inherit = 'sale.order'
+    _prompt_export_spec = ORDER_EXPORT_SPEC
+
+    prompt_fingerprint = fields.Char(
+        copy=False, readonly=True,
+        help='Hash of the rows last written to Google Sheets for this order.')
 
     # ---------------------------------------------------------------------
-    # Credenciales y acceso a Google Sheets
+    # Construcción de filas
     # ---------------------------------------------------------------------
 
-    def _get_google_sheet_credentials(self):
-        _logger.info("Retrieving Google Sheets credentials from config parameters")
-        param = self.env['ir.config_parameter'].sudo()
-        key_content = param.get_param('sale_order_prompt_extractor.google_service_account_key')
-        if not key_content:
-            _logger.error("No Google Service Account Key found in settings")
-            raise UserError(_("Google Service Account Key is not set in settings."))
-        try:
-            return json.loads(key_content)
-        except json.JSONDecodeError:
-            _logger.error("Invalid JSON for Google Service Account Key")
-            raise UserError(_("The Google Service Account Key is not a valid JSON."))
-
-    def _get_worksheet(self, company_name):
-        _logger.info("Connecting to Google Sheet at configured URL and worksheet for company: %s", company_name)
-        param = self.env['ir.config_parameter'].sudo()
-        sheet_url = param.get_param('sale_order_prompt_extractor.google_sheet_url')
-        
-        # Obtener mapeo de empresas a hojas
-        company_mapping_str = param.get_param('sale_order_prompt_extractor.company_sheet_mapping')
-        default_worksheet = param.get_param('sale_order_prompt_extractor.google_sheet_worksheet_name', 'PED G')
-        
-
-        
-        # Determinar qué hoja usar
-        worksheet_name = default_worksheet
-        if company_name and company_mapping_str:
-            try:
-                company_mapping = json.loads(company_mapping_str)
-                worksheet_name = company_mapping.get(company_name, default_worksheet)
-                _logger.info("Company '%s' mapped to worksheet '%s'", company_name, worksheet_name)
-            except json.JSONDecodeError:
-                _logger.warning("Invalid JSON in company mapping, using default worksheet")
-                worksheet_name = default_worksheet
-
-        if not sheet_url:
-            raise UserError(_("Google Sheet URL is not set in settings."))
-        if gspread is None:
-            raise UserError(_("The 'gspread' library is not installed. Please install it with: pip install gspread google-auth-oauthlib"))
-
-        creds_dict = self._get_google_sheet_credentials()
-        scopes = [
-            'https://www.googleapis.com/auth/spreadsheets',
-            'https://www.googleapis.com/auth/drive',
-        ]
-        creds = Credentials.from_service_account_info(creds_dict, scopes=scopes)
-        client = gspread.authorize(creds)
-
-        try:
-            sheet = client.open_by_url(sheet_url)
-            worksheet = sheet.worksheet(worksheet_name)
-            _logger.info("Successfully accessed worksheet '%s' for company '%s'", worksheet_name, company_name)
-            return worksheet
-        except gspread.exceptions.SpreadsheetNotFound:
-            raise UserError(_("Spreadsheet not found at the provided URL."))
-        except gspread.exceptions.WorksheetNotFound:
-            raise UserError(_("Worksheet '%s' not found in the spreadsheet." % worksheet_name))
-        except Exception as e:
-            _logger.error("Error accessing Google Sheets for company '%s': %s", company_name, str(e))
-            raise UserError(_("An error occurred while accessing Google Sheets for company '%s': %s" % (company_name, str(e))))
+    def _prepare_prompt_export_data(self):
+        """Carga en lote todo lo que las filas necesitan fuera del propio pedido.
 
-    # ---------------------------------------------------------------------
-    # Utilidades varias
-    # ---------------------------------------------------------------------
+        - Una sola búsqueda de facturas publicadas para todos los folios.
+        - Un tipo de cambio por (moneda, empresa, fecha) distinto.
+        - Productos, categorías y unidades de todas las líneas precargados.
+        - Un clasificador de productos con caché por producto.
+
+        Así el número de consultas no crece con el número de pedidos.
+        """
+        invoice_by_origin = {}
+        names = [name for name in self.mapped('name') if name]
+        if names:
+            invoices = self.env['account.move'].search([
+                ('invoice_origin', 'in', names),
+                ('move_type', '=', 'out_invoice'),
+                ('state', '=', 'posted')
+            ])
+            # Mismo orden que search(limit=1): la primera por folio gana
+            for invoice in invoices:
+                invoice_by_origin.setdefault(invoice.invoice_origin, invoice)
+
+        rates = self.env['prompt.rate.service']._get_rates(
+            (order.currency_id, order.company_id, order.date_order.date()) for order in self)
+
+        lines = self.order_line.filtered(lambda l: not l.display_type)
+        lines_by_order = {}
+        for line in lines:
+            lines_by_order.setdefault(line.order_id.id, []).append(line)
+        lines.mapped('product_id.display_name')
+        lines.mapped('product_id.categ_id.name')
+        lines.mapped('product_id.categ_id.parent_path')
+        lines.mapped('product_id.product_tag_ids')
+        lines.mapped('product_uom.name')
+        self.mapped('partner_id.name')
+        self.mapped('payment_term_id.name')
+
+        return {
+            'invoice_by_origin': invoice_by_origin,
+            'rates': rates,
+            'classifier': self.env['prompt.classification.rule']._get_classifier(),
+            'lines_by_order': lines_by_order,
+        }
 
-    @staticmethod
-    def _get_dias_credito(payment_term):
-        if not payment_term:
-            return "VERIFICAR"
-        name = payment_term.name.lower()
-        if "inmediato" in name or "immediate" in name or "contado" in name:
-            return 0
-        numbers = re.findall(r'\d+', name)
-        return int(numbers[0]) if numbers else "VERIFICAR"
+    def _get_prompt_rows(self, export_data):
+        """Construye las filas (23 columnas) del pedido a partir de los datos precargados.
+
+        Cada fila es una tupla con los valores crudos (números y fechas sin
+        formatear); el sink aplica el formato de cada columna al escribir.
+        """
+        self.ensure_one()
+        order = self
+
+        invoice = export_data['invoice_by_origin'].get(order.name)
+        factura = invoice.name if invoice else "VERIFICAR"
+        fecha = (invoice.invoice_date if invoice and invoice.invoice_date else order.date_order.date())
+        mes = fecha.month
+
+        oc = order.client_order_ref or "VERIFICAR"
+        folio = order.name or 'VERIFICAR'
+        cliente = order.partner_id.name or 'VERIFICAR'
+        engine = self.env['prompt.sync.engine']
+        dias_credito = engine._get_dias_credito(order.payment_term_id)
+        cred_cont = engine._get_tipo_credito(dias_credito)
+
+        moneda = engine._get_currency_label(order.currency_id)
+
+        # Tipo de cambio (order.currency -> MXN)
+        tc = export_data['rates'][(order.currency_id, order.company_id, order.date_order.date())]
+        classify = export_data['classifier'].classify
+
+        # Recorrer líneas no display_type
+        order_rows = []
+        for line in export_data['lines_by_order'].get(order.id, []):
+            concepto, categoria, familia = classify(line.product_id, line.name)
+            order_rows.append((
+                factura, mes, fecha, folio, oc, 'DOMICILIO', cliente,
+                line.product_id.default_code or '', concepto,
+                line.product_uom_qty, line.product_uom.name or '',
+                line.price_unit, line.price_subtotal, line.price_tax, line.price_total,
+                moneda, tc, line.price_total * tc,
+                dias_credito, cred_cont, categoria, familia, 'PENDIENTE',
+            ))
+        return order_rows
 
     # ---------------------------------------------------------------------
     # Acción principal: exportar / actualizar Sheet
     # ---------------------------------------------------------------------
 
     def action_extract_prompt_data(self):
-        """Exporta pedidos a Google Sheets.
+        """Encola los pedidos seleccionados para exportarlos en segundo plano.
 
-        - Si el folio (pedido interno) ya existe, se eliminan sus filas actuales y se
-          insertan las nuevas en la MISMA posición.
-        - Si hay menos filas nuevas que antiguas, las sobrantes quedan eliminadas.
-        - Si el folio no existe, simplemente se añaden al final.
-        - Agrupa pedidos por empresa para usar la hoja correspondiente.
+        La exportación la realiza el cron de ``prompt.export.job`` por lotes,
+        así la petición HTTP responde de inmediato sin importar la selección.
         """
-        # Agrupar pedidos por empresa
-        orders_by_company = {}
-        for order in self:
-            company_name = order.company_id.name
-            if company_name not in orders_by_company:
-                orders_by_company[company_name] = []
-            orders_by_company[company_name].append(order)
-        
-        _logger.info("Processing orders for companies: %s", list(orders_by_company.keys()))
-        
-        any_change = False
-        
-        # Procesar cada empresa por separado
-        for company_name, company_orders in orders_by_company.items():
-            try:
-                worksheet = self._get_worksheet(company_name)
-                all_pids = worksheet.col_values(4)  # columna D = Pedido Interno
-                _logger.info("Processing %d orders for company '%s' in worksheet (existing folios: %d)", 
-                           len(company_orders), company_name, len(all_pids))
-            except UserError:
-                raise
-            except Exception as e:
-                _logger.error("Failed to connect to Google Sheets for company '%s': %s", company_name, str(e))
-                raise UserError(_("Failed to connect to Google Sheets for company '%s'. Check logs for details." % company_name))
-
-            # Procesar pedidos de esta empresa
-            for order in company_orders:
-                # ------------------------- Construir filas -------------------------
-                order_rows = []
-
-                invoice = self.env['account.move'].search([
-                    ('invoice_origin', '=', order.name),
-                    ('move_type', '=', 'out_invoice'),
-                    ('state', '=', 'posted')
-                ], limit=1)
-                factura = invoice.name if invoice else "VERIFICAR"
-                fecha_dt = (invoice.invoice_date if invoice and invoice.invoice_date else order.date_order.date())
-                fecha = fecha_dt.strftime('%Y-%m-%d')
-                mes = fecha_dt.month
-
-                oc = order.client_order_ref or "VERIFICAR"
-                dias_credito = self._get_dias_credito(order.payment_term_id)
-                cred_cont = (
-                    "CRÉDITO" if isinstance(dias_credito, int) and dias_credito > 0 else
-                    "CONTADO" if isinstance(dias_credito, int) else
-                    "VERIFICAR"
-                )
-
-                currency_map = {'MXN': 'Peso Mexicano', 'USD': 'Dólar Americano'}
-                moneda = currency_map.get(order.currency_id.name, order.currency_id.name or "")
-
-                # Tipo de cambio (order.currency -> MXN)
-                fecha_cot = order.date_order
-                try:
-                    tc = self.env['res.currency']._get_conversion_rate(
-                        order.currency_id,
-                        order.company_id.currency_id,
-                        order.company_id,
-                        fecha_cot.date()
-                    )
-                except Exception as e:
-                    tc = 1.0 if order.currency_id == order.company_id.currency_id else 0.0
-                    _logger.warning("Rate error for %s on %s: %s", order.currency_id.name, fecha_cot, str(e))
-
-                # Recorrer líneas no display_type
-                for line in order.order_line.filtered(lambda l: not l.display_type):
-                    full = line.product_id.display_name or ''
-                    concepto = re.sub(r'^\[.*?\]\s*', '', full)
-
-                    
-                    _logger.info("Using product name for concepto: %s", concepto)
-                    categoria = 'FABRICACION' if any(t in concepto.lower() for t in ['tabla', 'cono', 'módulo']) else 'COMERCIAL'
-                    familia = (line.product_id.categ_id.name or '').upper()
-                    total_mxn = line.price_total * tc if order.currency_id != order.company_id.currency_id else line.price_total
-
-                    order_rows.append([
-                        factura, str(mes), fecha, order.name or 'VERIFICAR', oc,
-                        'DOMICILIO', order.partner_id.name or 'VERIFICAR',
-                        line.product_id.default_code or '', concepto,
-                        str(line.product_uom_qty), line.product_uom.name or '',
-                        f"{line.price_unit:.2f}", f"{line.price_subtotal:.2f}",
-                        f"{line.price_tax:.2f}", f"{line.price_total:.2f}",
-                        moneda, f"{tc:.6f}", f"{total_mxn:.2f}",
-                        str(dias_credito), cred_cont, categoria, familia, 'PENDIENTE'
-                    ])
-
-                # --------------------------- Escribir Sheet ---------------------------
-                if order.name in all_pids:
-                    indices = [i + 1 for i, v in enumerate(all_pids) if v == order.name]
-                    start_idx = indices[0]
-                    _logger.info("Updating folio %s at rows %s (start %s) in company '%s'", 
-                               order.name, indices, start_idx, company_name)
-
-                    # Borrar existentes en orden descendente
-                    for idx in reversed(indices):
-                        worksheet.delete_rows(idx)
-                    # Insertar nuevas filas en la misma posición
-                    worksheet.insert_rows(order_rows, start_idx, value_input_option='USER_ENTERED')
-                    _logger.info("Inserted %d row(s) for folio %s at position %s in company '%s'", 
-                               len(order_rows), order.name, start_idx, company_name)
-                else:
-                    worksheet.append_rows(order_rows, value_input_option='USER_ENTERED')
-                    _logger.info("Appended %d row(s) for new folio %s in company '%s'", 
-                               len(order_rows), order.name, company_name)
-
-                any_change = True
-
-        # ------------------------- Notificación final -------------------------
-        title = _('Extraction Successful') if any_change else _('No New Data')
-        message = _('Sale orders exported / updated successfully.') if any_change else _('All selected orders are up to date.')
-
+        job = self.env['prompt.export.job']._enqueue(self._name, self.ids)
         return {
             'type': 'ir.actions.client',
             'tag': 'display_notification',
             'params': {
-                'title': title,
-                'message': message,
+                'title': _('Export Queued'),
+                'message': _('%(count)s sale order(s) queued for export (job %(job)s).') % {
+                    'count': len(self),
+                    'job': job.name,
+                },
                 'sticky': False,
             }
         }
+
+    def _export_prompt_data(self, sink=None):
+        """Exporta los pedidos con el motor común; ver ``prompt.sync.engine._export``."""
+        return self.env['prompt.sync.engine']._export(self, sink=sink)
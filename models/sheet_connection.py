@@ -0,0 +1,183 @@
+# -*- coding: utf-8 -*-
+
+import hashlib
+import logging
+
+try:
+    import gspread
+    from google.oauth2.service_account import Credentials
+except ImportError:
+    gspread = None
+
+from odoo import models, api, _
+from odoo.exceptions import UserError
+
+from ..tools import metrics
+from ..tools.fingerprint import FINGERPRINT_COLUMN
+from ..tools.retry import SHEETS_RATE_LIMITER, call_with_retry
+from ..tools.sheet_connection import SHEET_CONNECTIONS
+from ..tools.sheet_rebuild import create_worksheet
+from ..tools.sinks import GoogleSheetSink
+from .prompt_settings import parse_service_account_key
+
+_logger = logging.getLogger(__name__)
+
+SCOPES = [
+    'https://www.googleapis.com/auth/spreadsheets',
+    'https://www.googleapis.com/auth/drive',
+]
+
+
+class WorksheetBusy(UserError):
+    """Otra transacción está escribiendo en la hoja; conviene reintentar más tarde."""
+
+
+class PromptSheetConnection(models.AbstractModel):
+    _name = 'prompt.sheet.connection'
+    _description = 'Google Sheets Connection for Prompt Extractor'
+
+    # ---------------------------------------------------------------------
+    # Credenciales
+    # ---------------------------------------------------------------------
+
+    @api.model
+    def _get_google_sheet_credentials(self, key_content):
+        try:
+            return parse_service_account_key(key_content)
+        except ValueError:
+            _logger.error("Invalid JSON for Google Service Account Key")
+            raise UserError(_("The Google Service Account Key is not a valid JSON."))
+
+    @api.model
+    def _authorize(self, key_content):
+        """Crea un cliente gspread autorizado (sólo si no hay uno en caché)."""
+        _logger.info("Authorizing new Google Sheets client")
+        with metrics.span('credentials'):
+            creds_dict = self._get_google_sheet_credentials(key_content)
+            creds = Credentials.from_service_account_info(creds_dict, scopes=SCOPES)
+            return gspread.authorize(creds), creds
+
+    # ---------------------------------------------------------------------
+    # Acceso a worksheets
+    # ---------------------------------------------------------------------
+
+    @api.model
+    def _get_connection_settings(self):
+        """Configuración del módulo, comprobando que la conexión a Google Sheets es posible."""
+        settings = self.env['prompt.settings']._get_settings()
+        if not settings.sheet_url:
+            raise UserError(_("Google Sheet URL is not set in settings."))
+        if gspread is None:
+            raise UserError(_("The 'gspread' library is not installed. Please install it with: pip install gspread google-auth-oauthlib"))
+        if not settings.service_account_key:
+            _logger.error("No Google Service Account Key found in settings")
+            raise UserError(_("Google Service Account Key is not set in settings."))
+        return settings
+
+    @api.model
+    def _get_worksheet(self, worksheet_name, company_name=None, create=None):
+        """Devuelve el worksheet indicado usando la caché de conexiones del proceso.
+
+        Si la hoja no existe y se indica ``create`` (un ``SinkTarget``), se crea
+        con su encabezado en lugar de lanzar un error.
+        """
+        settings = self._get_connection_settings()
+        sheet_url = settings.sheet_url
+        key_content = settings.service_account_key
+
+        try:
+            with metrics.span('worksheet_open'):
+                worksheet = SHEET_CONNECTIONS.get_worksheet(
+                    self.env.cr.dbname, key_content, sheet_url, worksheet_name, self._authorize)
+            _logger.debug("Successfully accessed worksheet '%s' for company '%s'", worksheet_name, company_name)
+            return worksheet
+        except UserError:
+            raise
+        except gspread.exceptions.SpreadsheetNotFound:
+            raise UserError(_("Spreadsheet not found at the provided URL."))
+        except gspread.exceptions.WorksheetNotFound:
+            if create is None:
+                raise UserError(_("Worksheet '%s' not found in the spreadsheet." % worksheet_name))
+        except Exception as e:
+            _logger.error("Error accessing Google Sheets for company '%s': %s", company_name, str(e))
+            raise UserError(_("An error occurred while accessing Google Sheets for company '%s': %s" % (company_name, str(e))))
+        # Sólo se llega aquí si la hoja no existe y hay que crearla
+        return self._create_worksheet(create)
+
+    @api.model
+    def _get_spreadsheet(self):
+        """Spreadsheet configurada, de la caché de conexiones del proceso."""
+        settings = self._get_connection_settings()
+        try:
+            with metrics.span('worksheet_open'):
+                return SHEET_CONNECTIONS.get_spreadsheet(
+                    self.env.cr.dbname, settings.service_account_key, settings.sheet_url, self._authorize)
+        except gspread.exceptions.SpreadsheetNotFound:
+            raise UserError(_("Spreadsheet not found at the provided URL."))
+
+    @api.model
+    def _get_worksheet_titles(self):
+        """Títulos de todas las hojas de la spreadsheet, en una sola llamada."""
+        metadata = call_with_retry(self._get_spreadsheet().fetch_sheet_metadata, {'fields': 'sheets.properties.title'})
+        return [sheet['properties']['title'] for sheet in metadata.get('sheets', [])]
+
+    @api.model
+    def _create_worksheet(self, target):
+        """Crea la hoja de ``target`` con su encabezado, formatos y la columna de huellas oculta."""
+        spreadsheet = self._get_spreadsheet()
+        hidden_columns = [target.columns.index(FINGERPRINT_COLUMN) + 1] if FINGERPRINT_COLUMN in target.columns else []
+        with metrics.span('sheets_write'):
+            create_worksheet(spreadsheet, target.name, target.columns, hidden_columns=hidden_columns,
+                             formats=target.formats)
+        # Queda en la caché como cualquier otra hoja
+        return self._get_worksheet(target.name)
+
+    @api.model
+    def _get_target_worksheet(self, target):
+        """Worksheet de un destino del exportador; las hojas mensuales se crean al usarse por primera vez."""
+        partitioned = self.env['prompt.sync.engine']._is_partitioned()
+        return self._get_worksheet(target.name, create=target if partitioned else None)
+
+    @api.model
+    def _get_sheet_sink(self):
+        """Sink de exportación que escribe en las hojas de la spreadsheet configurada.
+
+        Las hojas se escriben en paralelo con hasta ``sheets_max_workers`` hilos;
+        el limitador compartido mantiene el total bajo ``sheets_requests_per_minute``.
+        """
+        settings = self.env['prompt.settings']._get_settings()
+        SHEETS_RATE_LIMITER.configure(settings.sheets_requests_per_minute)
+        return GoogleSheetSink(self._get_target_worksheet, self.env['prompt.sheet.index'],
+                               max_workers=settings.sheets_max_workers)
+
+    @api.model
+    def _get_stream_batch_size(self):
+        """Número de registros que una exportación lee y escribe por lote."""
+        return self.env['prompt.settings']._get_settings().stream_batch_size
+
+    # ---------------------------------------------------------------------
+    # Serialización por hoja
+    # ---------------------------------------------------------------------
+
+    @api.model
+    def _worksheet_lock_key(self, worksheet_name):
+        """Clave de advisory lock (bigint) de una hoja de la spreadsheet configurada."""
+        sheet_url = self.env['prompt.settings']._get_settings().sheet_url or ''
+        digest = hashlib.blake2b(('%s\x00%s' % (sheet_url, worksheet_name)).encode('utf-8'), digest_size=8).digest()
+        return int.from_bytes(digest, 'big', signed=True)
+
+    @api.model
+    def _lock_worksheets(self, worksheet_names):
+        """Reserva las hojas indicadas hasta el final de la transacción.
+
+        Dos escritores que leen la columna de claves de una misma hoja y luego
+        insertan o eliminan filas se pisan los índices, así que sólo una
+        transacción a la vez puede escribir en cada hoja. Los locks se piden en
+        orden para que dos exportaciones nunca se esperen mutuamente; si una
+        hoja está ocupada se lanza :class:`WorksheetBusy` sin esperar.
+        """
+        for worksheet_name in sorted(set(worksheet_names)):
+            self.env.cr.execute('SELECT pg_try_advisory_xact_lock(%s)', [self._worksheet_lock_key(worksheet_name)])
+            if not self.env.cr.fetchone()[0]:
+                raise WorksheetBusy(_("Worksheet '%s' is being written by another export, please try again later.",
+                                      worksheet_name))
@@ -0,0 +1,4 @@
+# -*- coding: utf-8 -*-
+from . import test_export_queries
+from . import test_sheet_batch
+from . import test_classifier
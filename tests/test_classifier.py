@@ -0,0 +1,58 @@
+# -*- coding: utf-8 -*-
+
+from odoo.tests import tagged
+from odoo.tests.common import BaseCase
+
+from ..tools.classifier import CompiledRules, ProductClassifier, Rule
+
+
+def keyword_rule(rule_id, sequence, value, tipo, familia=None):
+    return Rule(rule_id, sequence, 'keyword', value, tipo, familia)
+
+
+@tagged('post_install', '-at_install')
+class TestClassifier(BaseCase):
+    """Cada palabra clave que aparece en el nombre cuenta, aunque se solape con otra."""
+
+    def _classify(self, rules, name):
+        return ProductClassifier(CompiledRules(rules)).classify(None, name)
+
+    def test_nested_keyword_lowest_sequence_wins(self):
+        rules = [
+            keyword_rule(1, 1, 'tab', 'TAB', 'TABLAS'),
+            keyword_rule(2, 20, 'tabla', 'TABLA', 'OTRAS'),
+        ]
+        compiled = CompiledRules(rules)
+        self.assertEqual(compiled.match('tabla grande'), [0, 1])
+        result = self._classify(rules, 'Tabla grande')
+        self.assertEqual(result.tipo, 'TAB')
+        self.assertEqual(result.familia, 'TABLAS')
+
+    def test_overlapping_keywords(self):
+        rules = [
+            keyword_rule(1, 5, 'sabor', 'SABOR', 'SABORES'),
+            keyword_rule(2, 10, 'mesa', 'MESA', 'MUEBLES'),
+        ]
+        compiled = CompiledRules(rules)
+        self.assertEqual(compiled.match('MESABOR'), [0, 1])
+        self.assertEqual(self._classify(rules, '[MS1] Mesabor').tipo, 'SABOR')
+
+    def test_longer_keyword_with_lower_sequence(self):
+        rules = [
+            keyword_rule(1, 1, 'tabla', 'TABLA', 'TABLAS'),
+            keyword_rule(2, 20, 'tab', 'TAB'),
+        ]
+        self.assertEqual(self._classify(rules, 'tabla').tipo, 'TABLA')
+        self.assertEqual(self._classify(rules, 'tableta').tipo, 'TAB')
+
+    def test_fields_from_different_rules(self):
+        rules = [
+            keyword_rule(1, 1, 'cono', 'CONO'),
+            keyword_rule(2, 2, 'conos', 'CONOS', 'BARQUILLOS'),
+        ]
+        result = self._classify(rules, 'Conos de galleta')
+        self.assertEqual((result.concepto, result.tipo, result.familia), ('Conos de galleta', 'CONO', 'BARQUILLOS'))
+
+    def test_no_match_uses_default(self):
+        result = self._classify([keyword_rule(1, 1, 'tabla', 'TABLA')], 'Vaso')
+        self.assertEqual((result.tipo, result.familia), ('COMERCIAL', ''))
@@ -0,0 +1,49 @@
+# -*- coding: utf-8 -*-
+
+from odoo.tests import TransactionCase, tagged
+
+from ..tools.rate_cache import RATE_CACHE
+from ..tools.sinks import MemorySink
+
+
+@tagged('post_install', '-at_install')
+class TestExportQueries(TransactionCase):
+    """El número de consultas de una exportación no depende del número de pedidos."""
+
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        # Todos los pedidos de una medición en un solo lote
+        cls.env['ir.config_parameter'].sudo().set_param('sale_order_prompt_extractor.stream_batch_size', 500)
+        cls.partner = cls.env['res.partner'].create({'name': 'Prompt Test Customer'})
+        cls.products = cls.env['product.product'].create([
+            {'name': 'Tabla de cono %d' % index, 'default_code': 'TAB%d' % index, 'list_price': 10.0 * (index + 1)}
+            for index in range(3)
+        ])
+        cls.orders = cls.env['sale.order'].create([{
+            'partner_id': cls.partner.id,
+            'client_order_ref': 'OC-%d' % index,
+            'order_line': [(0, 0, {
+                'product_id': product.id,
+                'product_uom_qty': index + 1,
+                'price_unit': product.list_price,
+            }) for product in cls.products],
+        } for index in range(110)])
+
+    def _count_export_queries(self, orders):
+        # Mismo punto de partida en cada medición: sin registros ni tasas en caché
+        self.env.invalidate_all()
+        RATE_CACHE.clear()
+        sink = MemorySink()
+        start = self.cr.sql_log_count
+        orders._export_prompt_data(sink=sink)
+        count = self.cr.sql_log_count - start
+        self.assertEqual(sum(len(sink.rows(name)) for name in sink.targets), 3 * len(orders))
+        return count
+
+    def test_order_export_queries_do_not_grow_with_orders(self):
+        # Calienta las cachés del proceso (parámetros, clasificador)
+        self._count_export_queries(self.orders[100:])
+        small = self._count_export_queries(self.orders[:10])
+        large = self._count_export_queries(self.orders[:100])
+        self.assertEqual(small, large)
@@ -0,0 +1,140 @@
+# -*- coding: utf-8 -*-
+
+import random
+
+from odoo.tests import tagged
+from odoo.tests.common import BaseCase
+
+from ..tools.fake_sheet import FakeSpreadsheet
+from ..tools.retry import SHEETS_RATE_LIMITER
+from ..tools.sheet_batch import SheetWritePlan
+
+HEADER = ['FOLIO', 'PRODUCTO', 'CANTIDAD']
+WIDTH = len(HEADER)
+
+
+def naive_upsert(rows, upserts):
+    """Referencia: aplica cada upsert fila a fila, como lo haría ``delete_rows``/``insert_rows``."""
+    rows = [list(row) for row in rows]
+    for key, new_rows in upserts:
+        positions = [index for index, row in enumerate(rows) if index and row[0] == key]
+        if not positions:
+            rows.extend(list(row) for row in new_rows)
+            continue
+        first = positions[0]
+        for index in reversed(positions):
+            del rows[index]
+        rows[first:first] = [list(row) for row in new_rows]
+    return rows
+
+
+def document_rows(key, count, version='v1'):
+    return [[key, 'P%d-%s' % (line, version), 'Q%d' % line] for line in range(count)]
+
+
+@tagged('post_install', '-at_install')
+class TestSheetWritePlan(BaseCase):
+    """El plan por lotes deja la hoja igual que aplicar cada cambio fila a fila."""
+
+    def setUp(self):
+        super().setUp()
+        # La hoja es local: sin esperas del limitador de peticiones
+        rate, capacity = SHEETS_RATE_LIMITER.rate, SHEETS_RATE_LIMITER.capacity
+        SHEETS_RATE_LIMITER.configure(10 ** 9, burst=10 ** 9)
+        self.addCleanup(SHEETS_RATE_LIMITER.configure, rate * 60, burst=capacity)
+
+    def _make_sheet(self, rows):
+        spreadsheet = FakeSpreadsheet()
+        worksheet = spreadsheet.add_worksheet('Ventas', [HEADER] + rows)
+        return spreadsheet, worksheet
+
+    def _run_plan(self, spreadsheet, worksheet, upserts, prefetch=False):
+        plan = SheetWritePlan(worksheet, worksheet.col_values(1))
+        if prefetch:
+            self.assertTrue(plan.prefetch([key for key, rows in upserts], WIDTH, key_column=1))
+        for key, rows in upserts:
+            plan.upsert(key, rows)
+        final_keys = plan.final_keys()
+        # Sólo cuentan las llamadas de la escritura
+        spreadsheet.calls.clear()
+        plan.execute()
+        return plan, final_keys
+
+    def _sheet_rows(self, worksheet):
+        rows = [(row + [''] * WIDTH)[:WIDTH] for row in worksheet.rows]
+        while rows and not any(rows[-1]):
+            rows.pop()
+        return rows
+
+    def _check(self, initial, upserts, prefetch=False):
+        spreadsheet, worksheet = self._make_sheet(initial)
+        expected = naive_upsert([HEADER] + initial, upserts)
+        plan, final_keys = self._run_plan(spreadsheet, worksheet, upserts, prefetch)
+        self.assertEqual(self._sheet_rows(worksheet), expected)
+        self.assertEqual(final_keys, [row[0] for row in expected])
+        return spreadsheet, plan
+
+    def test_combined_deletes_inserts_updates(self):
+        initial = (
+            document_rows('A', 2) + document_rows('B', 1) + document_rows('C', 3)
+            + document_rows('A', 1) + document_rows('D', 2) + document_rows('E', 1))
+        upserts = [
+            ('A', document_rows('A', 4, 'v2')),  # crece y pierde la fila dispersa
+            ('B', document_rows('B', 2, 'v2')),  # crece
+            ('C', document_rows('C', 1, 'v2')),  # encoge
+            ('D', document_rows('D', 2, 'v2')),  # misma cantidad de filas
+            ('F', document_rows('F', 2, 'v2')),  # nuevo
+        ]
+        spreadsheet, plan = self._check(initial, upserts)
+        # Un batchUpdate estructural, un values.batchUpdate y un append_rows
+        self.assertEqual(spreadsheet.api_calls, 3)
+        self.assertEqual(spreadsheet.calls['batch_update'], 1)
+        self.assertEqual(spreadsheet.calls['values_batch_update'], 1)
+        self.assertEqual(spreadsheet.calls['append_rows'], 1)
+        self.assertEqual(plan.stats['api_calls'], 3)
+        self.assertEqual(plan.stats['inserted'], 3)
+        self.assertEqual(plan.stats['deleted'], 3)
+        self.assertEqual(plan.stats['appended'], 2)
+
+    def test_updates_only(self):
+        initial = document_rows('A', 2) + document_rows('B', 1)
+        upserts = [('A', document_rows('A', 2, 'v2')), ('B', document_rows('B', 1, 'v2'))]
+        spreadsheet, plan = self._check(initial, upserts)
+        self.assertEqual(spreadsheet.api_calls, 1)
+        self.assertEqual(spreadsheet.calls['values_batch_update'], 1)
+
+    def test_unchanged_rows_with_prefetch(self):
+        initial = document_rows('A', 2) + document_rows('B', 1)
+        upserts = [('A', document_rows('A', 2)), ('B', document_rows('B', 1))]
+        spreadsheet, plan = self._check(initial, upserts, prefetch=True)
+        self.assertFalse(plan.has_changes)
+        self.assertEqual(spreadsheet.api_calls, 0)
+        self.assertEqual(plan.stats['unchanged'], 3)
+
+    def test_changed_cells_with_prefetch(self):
+        initial = document_rows('A', 3) + document_rows('B', 2) + document_rows('C', 1)
+        changed = document_rows('B', 2)
+        changed[1][2] = 'Q9'
+        upserts = [
+            ('A', document_rows('A', 2)),
+            ('B', changed),
+            ('C', document_rows('C', 3, 'v2')),
+        ]
+        spreadsheet, plan = self._check(initial, upserts, prefetch=True)
+        self.assertEqual(spreadsheet.api_calls, 2)
+        self.assertEqual(plan.stats['unchanged'], 3)
+
+    def test_random_plans(self):
+        rng = random.Random(20240601)
+        for iteration in range(200):
+            keys = ['K%d' % index for index in range(rng.randint(1, 12))]
+            initial = []
+            for _step in range(rng.randint(0, 20)):
+                initial += document_rows(rng.choice(keys), rng.randint(1, 3), 'old')
+            new_keys = keys + ['N%d' % index for index in range(3)]
+            upserts = [
+                (key, document_rows(key, rng.randint(1, 4), 'v%d' % iteration))
+                for key in rng.sample(new_keys, rng.randint(1, len(new_keys)))]
+            with self.subTest(iteration=iteration):
+                spreadsheet, plan = self._check(initial, upserts)
+                self.assertLessEqual(spreadsheet.api_calls, 3)
@@ -0,0 +1,4 @@
+# -*- coding: utf-8 -*-
+from .sheet_batch import SheetWritePlan
+from .fake_sheet import FakeSpreadsheet, FakeWorksheet
+from .sinks import ExportSink, GoogleSheetSink, FileSink, MemorySink, SinkTarget
@@ -0,0 +1,247 @@
+# -*- coding: utf-8 -*-
+"""Benchmark de las exportaciones con datos sintéticos y una hoja en memoria.
+
+Se ejecuta desde ``odoo-bin shell`` sobre una base de datos con el módulo
+instalado::
+
+    from odoo.addons.sale_order_prompt_extractor.tools.benchmark import run_benchmark
+    run_benchmark(env, sizes=(100, 1000, 10000), output='/tmp/prompt_bench.json')
+
+Para cada tamaño se generan empresas, clientes, productos, pedidos y facturas
+sintéticos dentro de un savepoint que se revierte al final, y se ejecutan las
+dos exportaciones tres veces contra un :class:`FakeSpreadsheet`: la primera
+añade todas las filas (``cold``), la segunda omite los documentos por su
+huella (``unchanged``) y la tercera, con las huellas borradas, los reexporta
+por el camino del índice de claves y el diff (``warm``).
+"""
+
+import datetime
+import gc
+import json
+import logging
+import platform
+import random
+import time
+import tracemalloc
+
+from .fake_sheet import FakeSpreadsheet
+from .fingerprint import clear_fingerprints
+from .retry import SHEETS_RATE_LIMITER
+from .sheet_batch import MAX_CELLS_PER_CALL
+from .sinks import GoogleSheetSink
+
+_logger = logging.getLogger(__name__)
+
+DEFAULT_SIZES = (100, 1000, 10000)
+PHASES = ('cold', 'unchanged', 'warm')
+CREATE_BATCH = 500
+PRODUCT_NAMES = ['Tabla', 'Cono', 'Módulo', 'Ladrillo', 'Mortero', 'Placa', 'Soporte', 'Cemento']
+
+
+class _MemoryKeyIndex(object):
+    """Equivalente en memoria de ``prompt.sheet.index`` para no escribir en la base de datos."""
+
+    def __init__(self):
+        self._keys = {}
+
+    def _get_keys(self, worksheet, key_column, force=False):
+        cache_key = (worksheet.id, key_column)
+        if force or cache_key not in self._keys:
+            self._keys[cache_key] = worksheet.col_values(key_column)
+        return self._keys[cache_key]
+
+    def _execute_plan(self, plan, key_column):
+        final_keys = plan.final_keys()
+        stats = plan.execute()
+        self._keys[(plan.worksheet.id, key_column)] = final_keys
+        return stats
+
+
+def _bench_sink(spreadsheet, headers):
+    """Sink de Google Sheets que escribe en ``spreadsheet``, creando las hojas al vuelo."""
+    def open_worksheet(target):
+        spreadsheet.calls['worksheet'] += 1
+        try:
+            return spreadsheet._worksheets[target.name]
+        except KeyError:
+            return spreadsheet.add_worksheet(target.name, [headers])
+    return GoogleSheetSink(open_worksheet, _MemoryKeyIndex())
+
+
+# ---------------------------------------------------------------------------
+# Datos sintéticos
+# ---------------------------------------------------------------------------
+
+def _create_in_batches(model, vals_list):
+    records = model.browse()
+    for start in range(0, len(vals_list), CREATE_BATCH):
+        records |= model.create(vals_list[start:start + CREATE_BATCH])
+    return records
+
+
+def _make_master_data(env, companies, rnd):
+    company_records = env['res.company'].create([
+        {'name': 'PROMPT BENCH %d' % idx} for idx in range(companies)
+    ])
+    for company in company_records:
+        if not env['account.journal'].search([('company_id', '=', company.id), ('type', '=', 'sale')], limit=1):
+            env['account.chart.template'].try_loading('generic_coa', company, install_demo=False)
+    categories = env['product.category'].create([{'name': 'BENCH %s' % name} for name in PRODUCT_NAMES])
+    products = env['product.product'].create([{
+        'name': '%s BENCH %d' % (PRODUCT_NAMES[idx % len(PRODUCT_NAMES)], idx),
+        'default_code': 'BENCH-%d' % idx,
+        'categ_id': categories[idx % len(categories)].id,
+        'list_price': rnd.uniform(10, 500),
+        'company_id': False,
+    } for idx in range(50)])
+    partners = env['res.partner'].create([{
+        'name': 'CLIENTE BENCH %d' % idx,
+        'vat': 'XAXX0101010%02d' % idx,
+        'company_id': False,
+    } for idx in range(20)])
+    return company_records, products, partners
+
+
+def _make_orders(env, size, lines, companies, products, partners, rnd):
+    vals_by_company = {}
+    for idx in range(size):
+        company = companies[idx % len(companies)]
+        vals_by_company.setdefault(company, []).append({
+            'company_id': company.id,
+            'partner_id': rnd.choice(partners).id,
+            'client_order_ref': 'OC-BENCH-%d' % idx,
+            'order_line': [(0, 0, {
+                'product_id': rnd.choice(products).id,
+                'product_uom_qty': rnd.randint(1, 50),
+                'price_unit': round(rnd.uniform(10, 500), 2),
+            }) for _ in range(lines)],
+        })
+    orders = env['sale.order'].browse()
+    for company, vals_list in vals_by_company.items():
+        orders |= _create_in_batches(env['sale.order'].with_company(company), vals_list)
+    return orders
+
+
+def _make_invoices(env, size, lines, companies, products, partners, rnd):
+    vals_by_company = {}
+    today = datetime.date.today()
+    for idx in range(size):
+        company = companies[idx % len(companies)]
+        vals_by_company.setdefault(company, []).append({
+            'move_type': 'out_invoice',
+            'company_id': company.id,
+            'partner_id': rnd.choice(partners).id,
+            'invoice_date': today - datetime.timedelta(days=rnd.randint(0, 365)),
+            'invoice_line_ids': [(0, 0, {
+                'product_id': rnd.choice(products).id,
+                'quantity': rnd.randint(1, 50),
+                'price_unit': round(rnd.uniform(10, 500), 2),
+            }) for _ in range(lines)],
+        })
+    invoices = env['account.move'].browse()
+    for company, vals_list in vals_by_company.items():
+        invoices |= _create_in_batches(env['account.move'].with_company(company), vals_list)
+    # Los borradores comparten el nombre '/': se publican para tener folios únicos
+    invoices.action_post()
+    return invoices
+
+
+# ---------------------------------------------------------------------------
+# Medición
+# ---------------------------------------------------------------------------
+
+def _measure(env, spreadsheet, run, trace_memory):
+    env.invalidate_all()
+    gc.collect()
+    spreadsheet.calls.clear()
+    if trace_memory:
+        tracemalloc.start()
+    queries = env.cr.sql_log_count
+    start = time.perf_counter()
+    stats = run()
+    wall = time.perf_counter() - start
+    peak = None
+    if trace_memory:
+        peak = tracemalloc.get_traced_memory()[1]
+        tracemalloc.stop()
+    rows = sum(stats.get(key, 0) for key in ('unchanged', 'updated', 'inserted', 'appended'))
+    return {
+        'wall_time_s': round(wall, 4),
+        'sql_queries': env.cr.sql_log_count - queries,
+        'api_calls': spreadsheet.api_calls,
+        'api_calls_by_method': dict(spreadsheet.calls),
+        'peak_memory_bytes': peak,
+        'rows': rows,
+        'rows_per_s': round(rows / wall, 1) if wall else None,
+        'stats': stats,
+    }
+
+
+def _run_size(env, size, lines, companies, trace_memory, seed):
+    results = []
+    rnd = random.Random(seed)
+    env.flush_all()
+    env.cr.execute('SAVEPOINT prompt_benchmark')
+    try:
+        company_records, products, partners = _make_master_data(env, companies, rnd)
+        orders = _make_orders(env, size, lines, company_records, products, partners, rnd)
+        invoices = _make_invoices(env, size, lines, company_records, products, partners, rnd)
+        env.flush_all()
+        _logger.info("Benchmark data ready: %d orders, %d invoices", len(orders), len(invoices))
+
+        engine = env['prompt.sync.engine']
+        for model_name, records in (('sale.order', orders), ('account.move', invoices)):
+            spreadsheet = FakeSpreadsheet()
+            sink = _bench_sink(spreadsheet, engine._get_spec(model_name).header)
+            for phase in PHASES:
+                if phase == 'warm':
+                    # Sin huellas nada se omite: se mide la reescritura real
+                    clear_fingerprints(records)
+                result = _measure(
+                    env, spreadsheet,
+                    lambda: engine._export(records.with_env(env), sink=sink),
+                    trace_memory)
+                result.update({'model': model_name, 'size': size, 'phase': phase})
+                results.append(result)
+                _logger.info("Benchmark %s size=%d %s: %.2fs, %d queries, %d API calls, %s rows/s",
+                             model_name, size, phase, result['wall_time_s'], result['sql_queries'],
+                             result['api_calls'], result['rows_per_s'])
+    finally:
+        env.cr.execute('ROLLBACK TO SAVEPOINT prompt_benchmark')
+        env.invalidate_all(flush=False)
+        env.registry.clear_cache()
+    return results
+
+
+def run_benchmark(env, sizes=DEFAULT_SIZES, lines=5, companies=2, output=None, trace_memory=True, seed=0):
+    """Mide ambas exportaciones para cada tamaño de ``sizes`` y devuelve los resultados.
+
+    ``lines`` es el número de líneas por documento. Si se indica ``output``, los
+    resultados se guardan en ese archivo JSON. ``trace_memory`` activa
+    ``tracemalloc`` para obtener el pico de memoria, a costa de un tiempo de
+    ejecución mayor.
+    """
+    report = {
+        'date': datetime.datetime.utcnow().isoformat(),
+        'python': platform.python_version(),
+        'module_version': env['ir.module.module'].search(
+            [('name', '=', 'sale_order_prompt_extractor')], limit=1).installed_version,
+        'lines_per_record': lines,
+        'companies': companies,
+        'stream_batch_size': env['prompt.sheet.connection']._get_stream_batch_size(),
+        'max_cells_per_call': MAX_CELLS_PER_CALL,
+        'results': [],
+    }
+    # La hoja en memoria no tiene cuota: el limitador sólo falsearía los tiempos
+    rate, capacity = SHEETS_RATE_LIMITER.rate, SHEETS_RATE_LIMITER.capacity
+    SHEETS_RATE_LIMITER.configure(10 ** 9, burst=10 ** 9)
+    try:
+        for size in sizes:
+            report['results'].extend(_run_size(env, size, lines, companies, trace_memory, seed))
+    finally:
+        SHEETS_RATE_LIMITER.configure(rate * 60, burst=capacity)
+
+    if output:
+        with open(output, 'w', encoding='utf-8') as handle:
+            json.dump(report, handle, indent=2, default=str)
+    return report
@@ -0,0 +1,93 @@
+# -*- coding: utf-8 -*-
+
+import re
+from collections import namedtuple
+
+# Prefijo "[CÓDIGO] " que Odoo antepone al nombre del producto
+DEFAULT_CODE_PREFIX = re.compile(r'^\[.*?\]\s*')
+DEFAULT_TIPO = 'COMERCIAL'
+
+# Regla compilada; ``sequence`` e ``id`` fijan la prioridad
+Rule = namedtuple('Rule', ['id', 'sequence', 'match_type', 'value', 'tipo', 'familia'])
+Classification = namedtuple('Classification', ['concepto', 'tipo', 'familia'])
+
+
+def strip_default_code(name):
+    return DEFAULT_CODE_PREFIX.sub('', name or '')
+
+
+class CompiledRules(object):
+    """Tabla de reglas de clasificación preparada para evaluarse en O(longitud del nombre).
+
+    Todas las palabras clave se combinan en una sola expresión regular; las
+    reglas por categoría y etiqueta se indexan por id. El objeto es inmutable y
+    puede compartirse entre exportaciones (se guarda en un ``ormcache``).
+    """
+
+    def __init__(self, rules):
+        self.rules = sorted(rules, key=lambda rule: (rule.sequence, rule.id))
+        self.by_keyword, self.by_category, self.by_tag = {}, {}, {}
+        index = {'keyword': self.by_keyword, 'category': self.by_category, 'tag': self.by_tag}
+        for position, rule in enumerate(self.rules):
+            value = rule.value.lower() if rule.match_type == 'keyword' else rule.value
+            index[rule.match_type].setdefault(value, []).append(position)
+        # Búsqueda anticipada de ancho cero: se prueba cada posición del texto, así
+        # que también se encuentran las palabras solapadas ("mesa" en "mesabor").
+        # En cada posición gana la palabra más larga; las que son prefijo de ella
+        # ("tab" de "tabla") se recuperan con ``keyword_prefixes``.
+        keywords = sorted(self.by_keyword, key=len, reverse=True)
+        self.keyword_prefixes = {
+            keyword: [prefix for prefix in keywords if keyword.startswith(prefix)] for keyword in keywords}
+        self.pattern = re.compile(
+            '(?=(%s))' % '|'.join(re.escape(keyword) for keyword in keywords)) if keywords else None
+
+    def match(self, text, category_ids=(), tag_ids=()):
+        """Posiciones (orden de prioridad) de las reglas que aplican."""
+        positions = set()
+        if self.pattern is not None and text:
+            for keyword in {found.group(1) for found in self.pattern.finditer(text.lower())}:
+                for prefix in self.keyword_prefixes[keyword]:
+                    positions.update(self.by_keyword[prefix])
+        for category_id in category_ids:
+            positions.update(self.by_category.get(category_id, ()))
+        for tag_id in tag_ids:
+            positions.update(self.by_tag.get(tag_id, ()))
+        return sorted(positions)
+
+
+class ProductClassifier(object):
+    """Clasificación (concepto, tipo, familia) con caché por producto.
+
+    Se crea uno por lote de exportación: un producto que ya apareció en el
+    lote se resuelve con una búsqueda en un diccionario.
+    """
+
+    def __init__(self, compiled, default_tipo=DEFAULT_TIPO):
+        self.compiled = compiled
+        self.default_tipo = default_tipo
+        self._cache = {}
+
+    def classify(self, product, name=None):
+        """Clasifica ``product``; ``name`` se usa si la línea no tiene producto."""
+        cache_key = product.id if product else ('name', name)
+        result = self._cache.get(cache_key)
+        if result is None:
+            result = self._cache[cache_key] = self._classify(product, name)
+        return result
+
+    def _classify(self, product, name):
+        concepto = strip_default_code(product.display_name if product else name)
+        category = product.categ_id if product else None
+        category_ids = [int(cid) for cid in category.parent_path.split('/') if cid] if category else ()
+        tag_ids = product.product_tag_ids.ids if product else ()
+
+        tipo = familia = None
+        for position in self.compiled.match(concepto, category_ids, tag_ids):
+            rule = self.compiled.rules[position]
+            tipo = tipo or rule.tipo
+            familia = familia or rule.familia
+            if tipo and familia:
+                break
+        if not familia:
+            familia = (category.name or '') if category else ''
+        return Classification(concepto, tipo or self.default_tipo, familia.upper())
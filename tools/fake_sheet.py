@@ -0,0 +1,218 @@
+# -*- coding: utf-8 -*-
+
+import re
+from collections import Counter
+
+_A1_RE = re.compile(r"^(?:'((?:[^']|'')*)'|([^!]+))!([A-Z]+)(\d+)(?::([A-Z]+)(\d+))?$")
+_COLUMN_RE = re.compile(r"^(?:'((?:[^']|'')*)'|([^!]+))!([A-Z]+)(\d+):\3$")
+
+
+def _col_index(letters):
+    col = 0
+    for char in letters:
+        col = col * 26 + ord(char) - 64
+    return col
+
+
+def parse_a1(range_name):
+    """Devuelve (hoja, fila, columna, última fila, última columna) de un rango A1."""
+    match = _A1_RE.match(range_name)
+    if not match:
+        raise ValueError("Unsupported A1 range: %s" % range_name)
+    quoted, plain, col, row, last_col, last_row = match.groups()
+    title = quoted.replace("''", "'") if quoted is not None else plain
+    row, col = int(row), _col_index(col)
+    if last_col is None:
+        return title, row, col, None, None
+    return title, row, col, int(last_row), _col_index(last_col)
+
+
+class FakeSpreadsheet(object):
+    """Hoja de cálculo en memoria que imita la parte de gspread usada por el módulo.
+
+    Cuenta cada llamada que en gspread sería una petición HTTP en ``calls`` para
+    poder comparar el número de round trips de distintas estrategias de escritura.
+    """
+
+    def __init__(self, spreadsheet_id='fake-spreadsheet'):
+        self.id = spreadsheet_id
+        self.calls = Counter()
+        self._worksheets = {}
+        self._next_id = 0
+
+    @property
+    def api_calls(self):
+        return sum(self.calls.values())
+
+    def add_worksheet(self, title, rows=None):
+        worksheet = FakeWorksheet(self, self._next_id, title, rows)
+        self._next_id += 1
+        self._worksheets[title] = worksheet
+        return worksheet
+
+    def worksheet(self, title):
+        self.calls['worksheet'] += 1
+        return self._worksheets[title]
+
+    def fetch_sheet_metadata(self, params=None):
+        self.calls['fetch_sheet_metadata'] += 1
+        return {'sheets': [{'properties': {
+            'sheetId': worksheet.id,
+            'title': worksheet.title,
+            'index': index,
+            'gridProperties': {'rowCount': worksheet.row_count, 'columnCount': 26},
+        }} for index, worksheet in enumerate(self._worksheets.values())]}
+
+    def _by_id(self, sheet_id):
+        for worksheet in self._worksheets.values():
+            if worksheet.id == sheet_id:
+                return worksheet
+        raise KeyError(sheet_id)
+
+    def _update_sheet(self, properties):
+        worksheet = self._by_id(properties['sheetId'])
+        sheets = [w for w in self._worksheets.values() if w is not worksheet]
+        index = properties.get('index', list(self._worksheets.values()).index(worksheet))
+        worksheet.title = properties.get('title', worksheet.title)
+        sheets.insert(index, worksheet)
+        self._worksheets = {w.title: w for w in sheets}
+
+    def batch_update(self, body):
+        self.calls['batch_update'] += 1
+        replies = []
+        for request in body.get('requests', []):
+            reply = {}
+            if 'addSheet' in request:
+                properties = request['addSheet']['properties']
+                worksheet = self.add_worksheet(properties['title'])
+                reply = {'addSheet': {'properties': {'sheetId': worksheet.id, 'title': worksheet.title}}}
+            elif 'deleteSheet' in request:
+                del self._worksheets[self._by_id(request['deleteSheet']['sheetId']).title]
+            elif 'updateSheetProperties' in request:
+                self._update_sheet(request['updateSheetProperties']['properties'])
+            elif 'updateDimensionProperties' in request or 'repeatCell' in request:
+                pass
+            elif 'appendDimension' in request:
+                worksheet = self._by_id(request['appendDimension']['sheetId'])
+                worksheet._pad(worksheet.row_count + request['appendDimension']['length'])
+            elif 'deleteDimension' in request:
+                rng = request['deleteDimension']['range']
+                worksheet = self._by_id(rng['sheetId'])
+                del worksheet.rows[rng['startIndex']:rng['endIndex']]
+            elif 'insertDimension' in request:
+                rng = request['insertDimension']['range']
+                worksheet = self._by_id(rng['sheetId'])
+                count = rng['endIndex'] - rng['startIndex']
+                worksheet._pad(rng['startIndex'])
+                worksheet.rows[rng['startIndex']:rng['startIndex']] = [[] for _ in range(count)]
+            else:
+                raise NotImplementedError(list(request))
+            replies.append(reply)
+        return {'replies': replies}
+
+    def values_batch_update(self, body):
+        self.calls['values_batch_update'] += 1
+        for data in body.get('data', []):
+            title, row, col = parse_a1(data['range'])[:3]
+            self._worksheets[title]._write(row, col, data['values'])
+        return {}
+
+    def values_batch_get(self, ranges, params=None):
+        """Sólo rangos de una columna abiertos por abajo (``'Hoja'!D2:D``)."""
+        self.calls['values_batch_get'] += 1
+        value_ranges = []
+        for range_name in ranges:
+            match = _COLUMN_RE.match(range_name)
+            if not match:
+                raise ValueError("Unsupported A1 range: %s" % range_name)
+            quoted, plain, col, row = match.groups()
+            title = quoted.replace("''", "'") if quoted is not None else plain
+            col = _col_index(col)
+            values = [r[col - 1] if len(r) >= col else '' for r in self._worksheets[title].rows[int(row) - 1:]]
+            while values and values[-1] == '':
+                values.pop()
+            value_range = {'range': range_name, 'majorDimension': 'COLUMNS'}
+            if values:
+                value_range['values'] = [values]
+            value_ranges.append(value_range)
+        return {'valueRanges': value_ranges}
+
+    def values_clear(self, range_name):
+        self.calls['values_clear'] += 1
+        title = range_name[1:-1].replace("''", "'") if range_name.startswith("'") else range_name
+        worksheet = self._worksheets[title]
+        worksheet.rows = [[] for _ in worksheet.rows]
+        return {}
+
+
+class FakeWorksheet(object):
+    """Worksheet en memoria: una lista de filas con valores de texto."""
+
+    def __init__(self, spreadsheet, sheet_id, title, rows=None):
+        self.spreadsheet = spreadsheet
+        self.id = sheet_id
+        self.title = title
+        self.rows = [list(row) for row in rows or []]
+
+    @property
+    def row_count(self):
+        return len(self.rows)
+
+    def _pad(self, length):
+        while len(self.rows) < length:
+            self.rows.append([])
+
+    def _write(self, row, col, values):
+        self._pad(row - 1 + len(values))
+        for offset, values_row in enumerate(values):
+            target = self.rows[row - 1 + offset]
+            needed = col - 1 + len(values_row)
+            target.extend([''] * (needed - len(target)))
+            target[col - 1:needed] = [str(v) for v in values_row]
+
+    # --- API de gspread -------------------------------------------------
+
+    def col_values(self, col):
+        self.spreadsheet.calls['col_values'] += 1
+        values = [row[col - 1] if len(row) >= col else '' for row in self.rows]
+        while values and not values[-1]:
+            values.pop()
+        return values
+
+    def get_all_values(self):
+        self.spreadsheet.calls['get_all_values'] += 1
+        return [list(row) for row in self.rows]
+
+    def batch_get(self, ranges, **kwargs):
+        self.spreadsheet.calls['batch_get'] += 1
+        result = []
+        for range_name in ranges:
+            if '!' not in range_name:
+                range_name = "'%s'!%s" % (self.title.replace("'", "''"), range_name)
+            row, col, last_row, last_col = parse_a1(range_name)[1:]
+            values = []
+            for current in self.rows[row - 1:(last_row or row)]:
+                values.append(list(current[col - 1:(last_col or col)]))
+            while values and not any(values[-1]):
+                values.pop()
+            result.append([[v for v in r] for r in values])
+        return result
+
+    def append_rows(self, values, value_input_option='RAW', table_range=None, **kwargs):
+        self.spreadsheet.calls['append_rows'] += 1
+        last = len(self.rows)
+        while last and not any(self.rows[last - 1]):
+            last -= 1
+        self._write(last + 1, 1, values)
+        return {}
+
+    def insert_rows(self, values, row=1, value_input_option='RAW', **kwargs):
+        self.spreadsheet.calls['insert_rows'] += 1
+        self._pad(row - 1)
+        self.rows[row - 1:row - 1] = [[str(v) for v in r] for r in values]
+        return {}
+
+    def delete_rows(self, start_index, end_index=None):
+        self.spreadsheet.calls['delete_rows'] += 1
+        del self.rows[start_index - 1:end_index or start_index]
+        return {}
@@ -0,0 +1,116 @@
+# -*- coding: utf-8 -*-
+"""Tramos de tiempo y contadores de una exportación.
+
+Las funciones :func:`span`, :func:`timed` y :func:`count` registran en las
+métricas activas (ver :func:`collect`) y no hacen nada si no hay ninguna, por
+lo que pueden llamarse desde cualquier punto del código sin coste apreciable.
+Las métricas activas viajan en un ``contextvars.ContextVar``: los hilos que
+escriben en Sheets las heredan si la tarea se ejecuta con ``copy_context()``.
+"""
+
+import contextvars
+import threading
+import time
+from collections import Counter
+from contextlib import contextmanager
+
+_CURRENT = contextvars.ContextVar('prompt_export_metrics', default=None)
+
+
+class ExportMetrics(object):
+    """Tramos (número, segundos totales y máximo por nombre) y contadores de una exportación.
+
+    Los tramos de hilos distintos se suman, así que el total de un tramo puede
+    superar la duración de la exportación cuando las hojas se escriben en paralelo.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.spans = {}
+        self.counters = Counter()
+
+    def add_span(self, name, seconds):
+        with self._lock:
+            entry = self.spans.setdefault(name, [0, 0.0, 0.0])
+            entry[0] += 1
+            entry[1] += seconds
+            entry[2] = max(entry[2], seconds)
+
+    def count(self, name, value=1):
+        with self._lock:
+            self.counters[name] += value
+
+    def span_seconds(self, name):
+        return self.spans.get(name, (0, 0.0, 0.0))[1]
+
+    def as_dict(self):
+        with self._lock:
+            return {
+                'spans': {name: {'count': count, 'total_s': round(total, 6), 'max_s': round(peak, 6)}
+                          for name, (count, total, peak) in sorted(self.spans.items())},
+                'counters': dict(self.counters),
+            }
+
+
+def current():
+    """Métricas activas en este contexto, o ``None``."""
+    return _CURRENT.get()
+
+
+@contextmanager
+def collect(metrics=None):
+    """Activa ``metrics`` (o unas nuevas) mientras dura el bloque y las devuelve."""
+    metrics = metrics if metrics is not None else ExportMetrics()
+    token = _CURRENT.set(metrics)
+    try:
+        yield metrics
+    finally:
+        _CURRENT.reset(token)
+
+
+@contextmanager
+def span(name):
+    metrics = _CURRENT.get()
+    if metrics is None:
+        yield
+        return
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        metrics.add_span(name, time.perf_counter() - start)
+
+
+def timed(name, func, *args, **kwargs):
+    """Llama a ``func`` registrando su duración en el tramo ``name``."""
+    with span(name):
+        return func(*args, **kwargs)
+
+
+def count(name, value=1):
+    metrics = _CURRENT.get()
+    if metrics is not None:
+        metrics.count(name, value)
+
+
+def _labels(labels):
+    if not labels:
+        return ''
+    return '{%s}' % ','.join(
+        '%s="%s"' % (key, str(value).replace('\\', '\\\\').replace('"', '\\"'))
+        for key, value in sorted(labels.items()))
+
+
+def prometheus_text(metrics):
+    """Formato de exposición de texto de Prometheus.
+
+    ``metrics`` es una lista de ``(nombre, tipo, ayuda, muestras)`` donde cada
+    muestra es un par ``(etiquetas, valor)``.
+    """
+    lines = []
+    for name, metric_type, help_text, samples in metrics:
+        lines.append('# HELP %s %s' % (name, help_text))
+        lines.append('# TYPE %s %s' % (name, metric_type))
+        for labels, value in samples:
+            lines.append('%s%s %s' % (name, _labels(labels), repr(float(value))))
+    return '\n'.join(lines) + '\n'
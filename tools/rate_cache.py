@@ -0,0 +1,65 @@
+# -*- coding: utf-8 -*-
+
+import threading
+import time
+from collections import OrderedDict
+
+# Otros workers no ven la invalidación local: la caducidad acota cuánto
+# tiempo pueden usar un tipo de cambio ya corregido.
+DEFAULT_TTL = 10 * 60
+DEFAULT_MAX_SIZE = 4096
+
+
+class RateCache(object):
+    """Caché LRU por proceso de tipos de cambio ``(moneda, empresa, fecha) -> tasa``.
+
+    Las entradas se separan por ``scope`` (base de datos), caducan tras ``ttl``
+    segundos y se descartan todas las de un scope con :meth:`clear` cuando se
+    modifican los tipos de cambio.
+    """
+
+    def __init__(self, ttl=DEFAULT_TTL, max_size=DEFAULT_MAX_SIZE):
+        self.ttl = ttl
+        self.max_size = max_size
+        self._entries = OrderedDict()   # (scope, moneda, empresa, fecha) -> (tasa, creado)
+        self._lock = threading.Lock()
+
+    def __len__(self):
+        return len(self._entries)
+
+    def clear(self, scope=None):
+        with self._lock:
+            if scope is None:
+                self._entries.clear()
+                return
+            for cache_key in [k for k in self._entries if k[0] == scope]:
+                del self._entries[cache_key]
+
+    def get_many(self, scope, keys):
+        """Devuelve ``(encontrados, faltantes)`` para las claves ``(moneda, empresa, fecha)``."""
+        found, missing = {}, []
+        now = time.monotonic()
+        with self._lock:
+            for key in keys:
+                cache_key = (scope,) + tuple(key)
+                entry = self._entries.get(cache_key)
+                if entry is None or now - entry[1] > self.ttl:
+                    missing.append(key)
+                    continue
+                self._entries.move_to_end(cache_key)
+                found[key] = entry[0]
+        return found, missing
+
+    def update(self, scope, rates):
+        now = time.monotonic()
+        with self._lock:
+            for key, rate in rates.items():
+                cache_key = (scope,) + tuple(key)
+                self._entries[cache_key] = (rate, now)
+                self._entries.move_to_end(cache_key)
+            while len(self._entries) > self.max_size:
+                self._entries.popitem(last=False)
+
+
+# Caché compartida por todos los modelos del worker
+RATE_CACHE = RateCache()
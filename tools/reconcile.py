@@ -0,0 +1,146 @@
+# -*- coding: utf-8 -*-
+"""Conciliación entre las hojas y Odoo.
+
+Las columnas de clave y de huella de todas las hojas se leen con un solo
+``values.batchGet`` y se cruzan con los folios de Odoo mediante diccionarios,
+en tiempo lineal respecto al número de filas. El resultado distingue:
+
+- folios huérfanos: están en la hoja pero no en Odoo (cancelados, borrados o
+  de una empresa que corresponde a otra hoja),
+- folios duplicados: aparecen en más de un bloque de filas contiguas,
+- documentos faltantes: están en Odoo pero nunca se exportaron,
+- documentos desactualizados: la huella de la hoja no coincide con la guardada.
+"""
+
+import logging
+
+from . import metrics
+from .retry import call_with_retry
+from .sheet_batch import MAX_STRUCTURAL_REQUESTS, col_letter
+
+_logger = logging.getLogger(__name__)
+
+# Folios de cada categoría que se detallan en el informe
+REPORT_SAMPLE = 20
+
+
+def _column_range(title, col, first_row=2):
+    return "'%s'!%s%d:%s" % (title.replace("'", "''"), col_letter(col), first_row, col_letter(col))
+
+
+def read_key_columns(spreadsheet, targets):
+    """Lee las columnas de clave y huella de ``targets`` en una sola llamada.
+
+    ``targets`` es una lista de ``(título, columna clave, columna huella)``
+    (1-based). Devuelve ``{título: (claves, huellas)}`` desde la fila 2; ambas
+    listas tienen la misma longitud.
+    """
+    ranges = []
+    for title, key_column, fingerprint_column in targets:
+        ranges.extend([_column_range(title, key_column), _column_range(title, fingerprint_column)])
+    if not ranges:
+        return {}
+    with metrics.span('sheets_read'):
+        result = call_with_retry(spreadsheet.values_batch_get, ranges, params={'majorDimension': 'COLUMNS'})
+    value_ranges = result.get('valueRanges', [])
+    columns = {}
+    for index, (title, key_column, fingerprint_column) in enumerate(targets):
+        keys, fingerprints = (
+            (value_ranges[2 * index + offset].get('values') or [[]])[0] for offset in (0, 1))
+        keys = [str(key).strip() for key in keys]
+        fingerprints = list(fingerprints) + [''] * (len(keys) - len(fingerprints))
+        columns[title] = (keys, fingerprints[:len(keys)])
+    return columns
+
+
+def key_runs(keys, first_row=2):
+    """Bloques de filas contiguas ``[(primera, última), ...]`` de cada folio no vacío."""
+    runs = {}
+    previous = None
+    for row, key in enumerate(keys, start=first_row):
+        if key and key == previous:
+            runs[key][-1][1] = row
+        elif key:
+            runs.setdefault(key, []).append([row, row])
+        previous = key
+    return runs
+
+
+class Reconciliation(object):
+    """Cruce de una hoja con los documentos de Odoo que le corresponden.
+
+    ``records`` es ``{folio: (id, huella)}``; la huella puede ser vacía para
+    documentos exportados antes de que existiera.
+    """
+
+    def __init__(self, title, res_model, keys, fingerprints, records):
+        self.title = title
+        self.res_model = res_model
+        self.row_count = len(keys)
+        runs = key_runs(keys)
+        self.orphans = {key: blocks for key, blocks in runs.items() if key not in records}
+        self.duplicates = {key: blocks for key, blocks in runs.items() if key in records and len(blocks) > 1}
+        self.duplicate_ids = sorted(records[key][0] for key in self.duplicates)
+        self.missing = sorted(record_id for key, (record_id, fp) in records.items() if key not in runs)
+        self.stale = sorted(
+            records[key][0] for key, blocks in runs.items()
+            if key in records and len(blocks) == 1 and records[key][1]
+            and any(fingerprints[row - 2] != records[key][1] for row in range(blocks[0][0], blocks[0][1] + 1)))
+
+    @property
+    def has_drift(self):
+        return bool(self.orphans or self.duplicates or self.missing or self.stale)
+
+    def rows_to_delete(self):
+        """Bloques a eliminar: los huérfanos y las repeticiones de cada folio duplicado."""
+        blocks = [block for runs in self.orphans.values() for block in runs]
+        blocks.extend(block for runs in self.duplicates.values() for block in runs[1:])
+        return sorted(blocks)
+
+    def ids_to_export(self):
+        """Documentos que hay que (re)exportar tras eliminar esos bloques."""
+        return sorted(set(self.missing) | set(self.stale) | set(self.duplicate_ids))
+
+    def summary(self):
+        return {
+            'worksheet': self.title,
+            'rows': self.row_count,
+            'orphans': len(self.orphans),
+            'orphan_rows': sum(last - first + 1 for runs in self.orphans.values() for first, last in runs),
+            'duplicates': len(self.duplicates),
+            'missing': len(self.missing),
+            'stale': len(self.stale),
+        }
+
+    def report_lines(self):
+        """Líneas de texto del informe, con una muestra de cada categoría."""
+        summary = self.summary()
+        lines = ["%(worksheet)s: %(rows)d row(s), %(orphans)d orphan folio(s) in %(orphan_rows)d row(s), "
+                 "%(duplicates)d duplicated folio(s), %(missing)d missing and %(stale)d outdated document(s)"
+                 % summary]
+
+        def blocks_text(runs):
+            return ', '.join('%d-%d' % (first, last) if last != first else str(first) for first, last in runs)
+
+        for label, items in (('Orphan', self.orphans), ('Duplicated', self.duplicates)):
+            for key in sorted(items, key=lambda k: items[k][0])[:REPORT_SAMPLE]:
+                lines.append("  %s %s: rows %s" % (label, key, blocks_text(items[key])))
+            if len(items) > REPORT_SAMPLE:
+                lines.append("  ... %d more" % (len(items) - REPORT_SAMPLE))
+        return lines
+
+
+def delete_row_blocks(worksheet, blocks):
+    """Elimina los bloques ``(primera, última)`` de abajo hacia arriba en pocas llamadas."""
+    requests = [{'deleteDimension': {'range': {
+        'sheetId': worksheet.id,
+        'dimension': 'ROWS',
+        'startIndex': first - 1,
+        'endIndex': last,
+    }}} for first, last in sorted(blocks, reverse=True)]
+    for start in range(0, len(requests), MAX_STRUCTURAL_REQUESTS):
+        with metrics.span('sheets_write'):
+            call_with_retry(worksheet.spreadsheet.batch_update,
+                            {'requests': requests[start:start + MAX_STRUCTURAL_REQUESTS]}, idempotent=False)
+    _logger.info("Deleted %d row block(s) from worksheet '%s'", len(blocks), worksheet.title)
+    return len(requests)
@@ -0,0 +1,145 @@
+# -*- coding: utf-8 -*-
+
+import logging
+import random
+import threading
+import time
+
+from . import metrics
+
+try:
+    import requests
+except ImportError:
+    requests = None
+
+_logger = logging.getLogger(__name__)
+
+# Respuestas de la API de Sheets que vale la pena reintentar
+TRANSIENT_STATUS = {408, 429, 500, 502, 503, 504}
+
+# Cuota de Sheets por usuario (la cuenta de servicio) y proyecto
+DEFAULT_REQUESTS_PER_MINUTE = 60
+MAX_RETRIES = 5
+BASE_BACKOFF = 1.0
+MAX_BACKOFF = 64.0
+
+
+def _status_code(exc):
+    response = getattr(exc, 'response', None)
+    code = getattr(response, 'status_code', None)
+    if code is None:
+        code = getattr(exc, 'code', None)
+    return code if isinstance(code, int) else None
+
+
+def is_transient_error(exc):
+    """Indica si ``exc`` (o alguna de sus causas) es un fallo temporal de Sheets.
+
+    Se revisa toda la cadena ``__cause__`` / ``__context__`` porque los modelos
+    envuelven los errores de gspread en ``UserError``.
+    """
+    seen = set()
+    while exc is not None and id(exc) not in seen:
+        seen.add(id(exc))
+        if _status_code(exc) in TRANSIENT_STATUS:
+            return True
+        if requests is not None and isinstance(exc, (requests.ConnectionError, requests.Timeout)):
+            return True
+        if isinstance(exc, (ConnectionError, TimeoutError)):
+            return True
+        exc = exc.__cause__ or exc.__context__
+    return False
+
+
+class StaleWorksheet(Exception):
+    """El worksheet ya no existe con el id del handle (otro proceso reconstruyó la hoja)."""
+
+
+def is_stale_worksheet_error(exc):
+    """Indica si ``exc`` (o alguna de sus causas) se debe a un handle cuyo sheetId ya no existe.
+
+    Tras sustituir una hoja por su staging, la hoja conserva el título pero no
+    el id, y la API responde 400 "No grid with id" a las peticiones por id.
+    """
+    seen = set()
+    while exc is not None and id(exc) not in seen:
+        seen.add(id(exc))
+        if isinstance(exc, StaleWorksheet):
+            return True
+        if _status_code(exc) == 400 and 'no grid with id' in str(exc).lower():
+            return True
+        exc = exc.__cause__ or exc.__context__
+    return False
+
+
+def _retry_after(exc):
+    """Segundos indicados en la cabecera ``Retry-After`` de la respuesta, si los hay."""
+    headers = getattr(getattr(exc, 'response', None), 'headers', None) or {}
+    try:
+        return float(headers.get('Retry-After'))
+    except (TypeError, ValueError):
+        return None
+
+
+class TokenBucket(object):
+    """Limitador de peticiones por minuto compartido entre hilos.
+
+    Se admiten ráfagas de hasta ``burst`` peticiones; a partir de ahí cada
+    :meth:`acquire` espera a que se recupere un token.
+    """
+
+    def __init__(self, requests_per_minute, burst=None):
+        self._lock = threading.Lock()
+        self.configure(requests_per_minute, burst)
+
+    def configure(self, requests_per_minute, burst=None):
+        rate = max(1, requests_per_minute) / 60.0
+        with self._lock:
+            if rate == getattr(self, 'rate', None) and not burst:
+                return
+            self.rate = rate
+            self.capacity = max(1, burst or min(10, requests_per_minute))
+            self._tokens = float(self.capacity)
+            self._updated = time.monotonic()
+
+    def acquire(self):
+        while True:
+            with self._lock:
+                now = time.monotonic()
+                self._tokens = min(self.capacity, self._tokens + (now - self._updated) * self.rate)
+                self._updated = now
+                if self._tokens >= 1:
+                    self._tokens -= 1
+                    return
+                wait = (1 - self._tokens) / self.rate
+            time.sleep(wait)
+
+
+# Limitador compartido por todos los hilos del worker
+SHEETS_RATE_LIMITER = TokenBucket(DEFAULT_REQUESTS_PER_MINUTE)
+
+
+def call_with_retry(func, *args, idempotent=True, **kwargs):
+    """Llama a la API de Sheets respetando el limitador y reintentando los fallos temporales.
+
+    Los reintentos usan backoff exponencial con jitter. Un 429 siempre se
+    reintenta porque la petición no se aplicó; los 5xx y errores de red sólo si
+    la llamada es ``idempotent``, ya que insertar o añadir filas dos veces
+    desordenaría la hoja.
+    """
+    for attempt in range(MAX_RETRIES + 1):
+        with metrics.span('rate_limit_wait'):
+            SHEETS_RATE_LIMITER.acquire()
+        metrics.count('sheets_requests')
+        try:
+            return func(*args, **kwargs)
+        except Exception as e:
+            retry = _status_code(e) == 429 or (idempotent and is_transient_error(e))
+            if not retry or attempt == MAX_RETRIES:
+                raise
+            delay = random.uniform(0, min(MAX_BACKOFF, BASE_BACKOFF * 2 ** attempt))
+            delay = max(delay, _retry_after(e) or 0)
+            _logger.warning("Google Sheets request failed (%s), retrying in %.1fs (attempt %d/%d)",
+                            e, delay, attempt + 1, MAX_RETRIES)
+            metrics.count('sheets_retries')
+            time.sleep(delay)
@@ -0,0 +1,91 @@
+# -*- coding: utf-8 -*-
+"""Formato de las columnas exportadas.
+
+Los constructores de filas entregan tuplas con valores crudos (``int``,
+``float``, ``date`` o texto) y cada sink los convierte una sola vez, al
+escribir, según el formato de la columna:
+
+- los sinks de archivo usan la representación de texto de siempre,
+- Google Sheets recibe números crudos (``RAW``; las fechas como número de
+  serie) y el formato de número de la columna, así que la API no tiene que
+  interpretar cada celda.
+
+Los valores que no son del tipo esperado (p. ej. ``"VERIFICAR"`` en una
+columna numérica) se escriben tal cual.
+"""
+
+import datetime
+from collections import namedtuple
+
+# ``text`` convierte el valor crudo a texto; ``number_format`` es el
+# ``numberFormat`` de Sheets de la columna (``None`` para texto libre) y
+# ``digits`` los decimales con que se guarda el número en Sheets.
+ColumnFormat = namedtuple('ColumnFormat', ['name', 'text', 'number_format', 'digits'])
+
+SHEETS_EPOCH = datetime.date(1899, 12, 30)
+NUMBER_TYPES = (int, float)
+
+TEXT = ColumnFormat('text', str, None, None)
+INTEGER = ColumnFormat('integer', str, {'type': 'NUMBER', 'pattern': '0'}, None)
+QUANTITY = ColumnFormat('quantity', str, {'type': 'NUMBER', 'pattern': '#,##0.###'}, None)
+DECIMAL = ColumnFormat('decimal', '{:.2f}'.format, {'type': 'NUMBER', 'pattern': '#,##0.00'}, 2)
+RATE = ColumnFormat('rate', '{:.6f}'.format, {'type': 'NUMBER', 'pattern': '0.000000'}, 6)
+MONEY = ColumnFormat('money', '${:.2f}'.format, {'type': 'CURRENCY', 'pattern': '"$"#,##0.00'}, 2)
+DATE_ISO = ColumnFormat('date_iso', lambda value: value.strftime('%Y-%m-%d'), {'type': 'DATE', 'pattern': 'yyyy-mm-dd'}, None)
+DATE_DMY = ColumnFormat('date_dmy', lambda value: value.strftime('%d/%m/%Y'), {'type': 'DATE', 'pattern': 'dd/mm/yyyy'}, None)
+
+
+def column_formats(columns, formats):
+    """Formato de cada columna de ``columns`` según el diccionario ``formats`` (texto por defecto)."""
+    return tuple(formats.get(name, TEXT) for name in columns)
+
+
+def _sheets_value(fmt):
+    if fmt.number_format and fmt.number_format['type'] == 'DATE':
+        return datetime.date, lambda value: (value - SHEETS_EPOCH).days
+    if fmt.digits is not None:
+        # Mismo valor que se guardaba cuando se enviaba el texto ya redondeado
+        return NUMBER_TYPES, lambda value: round(value, fmt.digits)
+    return None
+
+
+def _text_value(fmt):
+    if fmt is TEXT:
+        return None
+    types = datetime.date if fmt.number_format['type'] == 'DATE' else NUMBER_TYPES
+    return types, fmt.text
+
+
+def row_converter(formats, sheets=False):
+    """Función que convierte una fila cruda para un sink de texto o para Sheets.
+
+    Las conversiones se resuelven una vez por destino: por fila sólo se
+    recorren las columnas que las necesitan.
+    """
+    conversions = []
+    for idx, fmt in enumerate(formats or ()):
+        conversion = _sheets_value(fmt) if sheets else _text_value(fmt)
+        if conversion:
+            conversions.append((idx,) + conversion)
+
+    def convert(row):
+        row = ['' if value is None else value for value in row]
+        for idx, types, func in conversions:
+            if idx < len(row) and isinstance(row[idx], types) and not isinstance(row[idx], bool):
+                row[idx] = func(row[idx])
+        return row
+    return convert
+
+
+def number_format_requests(sheet_id, formats, first_row=2):
+    """Peticiones ``repeatCell`` que aplican el formato de número a columnas completas."""
+    return [{'repeatCell': {
+        'range': {
+            'sheetId': sheet_id,
+            'startRowIndex': first_row - 1,
+            'startColumnIndex': idx,
+            'endColumnIndex': idx + 1,
+        },
+        'cell': {'userEnteredFormat': {'numberFormat': fmt.number_format}},
+        'fields': 'userEnteredFormat.numberFormat',
+    }} for idx, fmt in enumerate(formats or ()) if fmt.number_format]
@@ -0,0 +1,380 @@
+# -*- coding: utf-8 -*-
+
+import json
+import logging
+from bisect import bisect_left, bisect_right
+
+from . import metrics
+from .retry import call_with_retry
+from .row_format import number_format_requests
+
+_logger = logging.getLogger(__name__)
+
+# Límites por llamada para no exceder el tamaño de payload de la API de Sheets
+MAX_STRUCTURAL_REQUESTS = 500
+MAX_CELLS_PER_CALL = 50000
+MAX_RANGES_PER_GET = 200
+
+
+def col_letter(col):
+    """Convierte un índice de columna (1-based) en su letra A1 (1 -> A, 27 -> AA)."""
+    letters = ''
+    while col > 0:
+        col, rem = divmod(col - 1, 26)
+        letters = chr(65 + rem) + letters
+    return letters
+
+
+def a1_range(title, row, col, last_row=None, last_col=None):
+    """Construye un rango A1 absoluto ('Hoja'!A1:C3) para la hoja indicada."""
+    quoted = "'%s'" % title.replace("'", "''")
+    start = '%s%d' % (col_letter(col), row)
+    if last_row is None:
+        return '%s!%s' % (quoted, start)
+    return '%s!%s:%s%d' % (quoted, start, col_letter(last_col), last_row)
+
+
+def _normalize_cell(value):
+    """Normaliza un valor para compararlo con lo que devuelve la hoja.
+
+    Las filas se escriben con números crudos y se leen sin formato, pero las
+    escritas antes como texto (``$1,234.50`` / ``20.0``) pueden seguir en la
+    hoja, por lo que se comparan como números cuando ambos lados lo son.
+    """
+    text = '' if value is None else str(value).strip()
+    try:
+        return round(float(text.replace('$', '').replace(',', '')), 6)
+    except ValueError:
+        return text
+
+
+def _chunks_by_cells(items, size_of, limit=MAX_CELLS_PER_CALL):
+    """Agrupa elementos en lotes cuyo número total de celdas no supera ``limit``."""
+    chunk, cells = [], 0
+    for item in items:
+        size = size_of(item)
+        if chunk and cells + size > limit:
+            yield chunk
+            chunk, cells = [], 0
+        chunk.append(item)
+        cells += size
+    if chunk:
+        yield chunk
+
+
+class SheetWritePlan(object):
+    """Plan de escritura por lotes para una sola hoja de cálculo.
+
+    Reúne todas las eliminaciones, actualizaciones en sitio e inserciones de
+    filas de una exportación y las envía en pocas llamadas a la API:
+
+    - un ``spreadsheets.batchUpdate`` con los ``deleteDimension`` /
+      ``insertDimension`` (troceado cada ``MAX_STRUCTURAL_REQUESTS``),
+    - un ``values.batchUpdate`` con los valores de las filas existentes e
+      insertadas,
+    - un ``append_rows`` con los folios que aún no existen en la hoja.
+
+    Si antes se llama a :meth:`prefetch`, las filas existentes se comparan
+    celda a celda y sólo se escriben las celdas que cambiaron.
+
+    Todas las posiciones se registran en coordenadas de la hoja ORIGINAL; los
+    cambios estructurales se aplican de abajo hacia arriba y los rangos de
+    valores se traducen a la posición final de cada fila.
+    """
+
+    def __init__(self, worksheet, key_values, value_input_option='RAW', formats=None):
+        self.worksheet = worksheet
+        self.value_input_option = value_input_option
+        self.formats = formats
+        self.key_values = list(key_values)
+        self.key_rows = {}
+        for row, value in enumerate(self.key_values, start=1):
+            if value:
+                self.key_rows.setdefault(value, []).append(row)
+        self._deletes = set()
+        self._inserts = {}    # fila original -> nº de filas a insertar ANTES de ella
+        self._writes = []     # (fila original, desplazamiento en inserción o None, {col: valor})
+        self._appends = []
+        self._append_keys = []
+        self._insert_keys = {}  # fila original -> folio de las filas insertadas
+        self._existing = {}   # folio -> filas actuales del bloque (ver prefetch)
+        self.stats = {
+            'unchanged': 0,
+            'deleted': 0,
+            'inserted': 0,
+            'updated': 0,
+            'appended': 0,
+            'api_calls': 0,
+        }
+
+    # ------------------------------------------------------------------
+    # Registro de operaciones
+    # ------------------------------------------------------------------
+
+    def _block(self, key):
+        """Devuelve (bloque contiguo inicial, filas dispersas) del folio en la hoja."""
+        rows = self.key_rows.get(key) or []
+        block = rows[:1]
+        for row in rows[1:]:
+            if row != block[-1] + 1:
+                break
+            block.append(row)
+        return block, rows[len(block):]
+
+    def prefetch(self, keys, width, key_column=None):
+        """Lee con un solo ``batch_get`` las filas actuales de los folios indicados.
+
+        Si se indica ``key_column``, comprueba que las filas leídas sigan siendo
+        del folio esperado y devuelve False si la columna de claves usada para
+        construir el plan ya no coincide con la hoja.
+        """
+        consistent = True
+        blocks = []
+        for key in keys:
+            block = self._block(key)[0]
+            if block:
+                blocks.append((key, block))
+        for start in range(0, len(blocks), MAX_RANGES_PER_GET):
+            chunk = blocks[start:start + MAX_RANGES_PER_GET]
+            ranges = ['A%d:%s%d' % (block[0], col_letter(width), block[-1]) for key, block in chunk]
+            with metrics.span('sheets_read'):
+                # Valores sin formato: se comparan con los valores crudos de las filas
+                results = call_with_retry(self.worksheet.batch_get, ranges, value_render_option='UNFORMATTED_VALUE')
+            self.stats['api_calls'] += 1
+            for (key, block), values in zip(chunk, results):
+                current = [list(row) for row in values]
+                current.extend([] for _ in range(len(block) - len(current)))
+                self._existing[key] = current
+                if key_column and any(
+                        (row[key_column - 1] if len(row) >= key_column else '') != key for row in current):
+                    consistent = False
+        return consistent
+
+    def verify_keys(self, keys, key_column):
+        """Comprueba que las filas de ``keys`` en la hoja sigan siendo de su folio.
+
+        Es la comprobación de :meth:`prefetch` para los destinos sin diff, que
+        no leen sus filas: sólo se lee la columna de claves de cada folio, con
+        un ``batch_get`` por cada ``MAX_RANGES_PER_GET`` folios. Devuelve False
+        si la hoja se reordenó o editó y la columna de claves ya no coincide.
+        """
+        consistent = True
+        col = col_letter(key_column)
+        spans = [(key, self.key_rows[key]) for key in keys if self.key_rows.get(key)]
+        for start in range(0, len(spans), MAX_RANGES_PER_GET):
+            chunk = spans[start:start + MAX_RANGES_PER_GET]
+            ranges = ['%s%d:%s%d' % (col, rows[0], col, rows[-1]) for key, rows in chunk]
+            with metrics.span('sheets_read'):
+                results = call_with_retry(self.worksheet.batch_get, ranges, value_render_option='UNFORMATTED_VALUE')
+            self.stats['api_calls'] += 1
+            for (key, rows), values in zip(chunk, results):
+                for row in rows:
+                    offset = row - rows[0]
+                    cell = values[offset] if offset < len(values) else []
+                    if (cell[0] if cell else '') != key:
+                        consistent = False
+        return consistent
+
+    def upsert(self, key, rows):
+        """Reemplaza las filas del folio ``key`` por ``rows`` (o las añade al final).
+
+        El bloque contiguo donde aparece el folio por primera vez se reutiliza en
+        sitio; las filas dispersas del mismo folio y las sobrantes se eliminan y
+        las faltantes se insertan dentro del bloque.
+        """
+        block, scattered = self._block(key)
+        existing = self._existing.get(key)
+        if existing is None:
+            existing = [None] * len(block)
+        if not block:
+            self._appends.extend(rows)
+            self._append_keys.extend([key] * len(rows))
+            self.stats['appended'] += len(rows)
+            return
+        self._deletes.update(scattered)
+        self.stats['deleted'] += len(scattered)
+
+        overlap = min(len(block), len(rows))
+        if len(rows) <= len(block):
+            for row, values, current in zip(block, rows, existing):
+                self._write(row, None, values, current)
+            surplus = block[overlap:]
+            self._deletes.update(surplus)
+            self.stats['deleted'] += len(surplus)
+            return
+
+        # Más filas nuevas que antiguas: se insertan antes de la última fila del
+        # bloque (siempre dentro de la rejilla) y se reparten los valores.
+        extra = len(rows) - len(block)
+        last = block[-1]
+        for row, values, current in zip(block[:-1], rows, existing):
+            self._write(row, None, values, current)
+        for offset, values in enumerate(rows[len(block) - 1:len(block) - 1 + extra]):
+            self._write(last, offset, values)
+        self._write(last, None, rows[-1], existing[-1])
+        self._inserts[last] = self._inserts.get(last, 0) + extra
+        self._insert_keys[last] = key
+        self.stats['inserted'] += extra
+
+    def _write(self, row, offset, values, current=None):
+        cells = dict(enumerate(values, start=1))
+        if current is not None:
+            # Sólo las celdas distintas; las sobrantes de la fila anterior se vacían
+            cells = {
+                col: value for col, value in cells.items()
+                if _normalize_cell(value) != _normalize_cell(current[col - 1] if col <= len(current) else '')
+            }
+            for col in range(len(values) + 1, len(current) + 1):
+                if current[col - 1] != '':
+                    cells[col] = ''
+            if not cells:
+                self.stats['unchanged'] += 1
+                return
+        self._writes.append((row, offset, cells))
+        if offset is None:
+            self.stats['updated'] += 1
+
+    def final_keys(self):
+        """Columna de claves que tendrá la hoja después de ejecutar el plan."""
+        keys = []
+        for row, value in enumerate(self.key_values, start=1):
+            keys.extend([self._insert_keys.get(row)] * self._inserts.get(row, 0))
+            if row not in self._deletes:
+                keys.append(value)
+        while keys and not keys[-1]:
+            keys.pop()
+        return keys + self._append_keys
+
+    @property
+    def has_changes(self):
+        return bool(self._deletes or self._inserts or self._writes or self._appends)
+
+    # ------------------------------------------------------------------
+    # Traducción de coordenadas
+    # ------------------------------------------------------------------
+
+    def _final_row(self, row, offset, deletes, insert_positions, insert_prefix):
+        """Posición final de una fila original (o insertada) tras los cambios estructurales."""
+        removed = bisect_left(deletes, row)
+        if offset is None:
+            # Las inserciones registradas en ``row`` quedan por encima de ella
+            added = insert_prefix[bisect_right(insert_positions, row)]
+            return row - removed + added
+        added = insert_prefix[bisect_left(insert_positions, row)]
+        return row - removed + added + offset
+
+    def _structural_requests(self):
+        sheet_id = self.worksheet.id
+        operations = []
+        deletes = sorted(self._deletes)
+        start = None
+        for idx, row in enumerate(deletes):
+            if start is None:
+                start = row
+            if idx + 1 == len(deletes) or deletes[idx + 1] != row + 1:
+                operations.append((start, 0, {'deleteDimension': {'range': {
+                    'sheetId': sheet_id,
+                    'dimension': 'ROWS',
+                    'startIndex': start - 1,
+                    'endIndex': row,
+                }}}))
+                start = None
+        for row, count in self._inserts.items():
+            operations.append((row, 1, {'insertDimension': {
+                'range': {
+                    'sheetId': sheet_id,
+                    'dimension': 'ROWS',
+                    'startIndex': row - 1,
+                    'endIndex': row - 1 + count,
+                },
+                'inheritFromBefore': False,
+            }}))
+        # De abajo hacia arriba: cada operación sólo desplaza filas ya procesadas
+        operations.sort(key=lambda op: (op[0], op[1]), reverse=True)
+        return [op[2] for op in operations]
+
+    def _value_ranges(self):
+        deletes = sorted(self._deletes)
+        insert_positions = sorted(self._inserts)
+        insert_prefix = [0]
+        for row in insert_positions:
+            insert_prefix.append(insert_prefix[-1] + self._inserts[row])
+
+        cells_by_row = {}
+        for row, offset, cells in self._writes:
+            final = self._final_row(row, offset, deletes, insert_positions, insert_prefix)
+            cells_by_row.setdefault(final, {}).update(cells)
+
+        # Agrupar celdas contiguas de una fila en segmentos y, después, segmentos
+        # con las mismas columnas en filas consecutivas en un solo rango.
+        segments = []
+        for final in sorted(cells_by_row):
+            cells = cells_by_row[final]
+            cols = sorted(cells)
+            first = cols[0]
+            for idx, col in enumerate(cols):
+                if idx + 1 == len(cols) or cols[idx + 1] != col + 1:
+                    segments.append((final, first, col, [cells[c] for c in range(first, col + 1)]))
+                    if idx + 1 < len(cols):
+                        first = cols[idx + 1]
+
+        ranges = []
+        for final, first, last, values in segments:
+            if ranges:
+                prev = ranges[-1]
+                if prev['first'] == first and prev['last'] == last and prev['end'] + 1 == final:
+                    prev['end'] = final
+                    prev['values'].append(values)
+                    continue
+            ranges.append({'start': final, 'end': final, 'first': first, 'last': last, 'values': [values]})
+
+        title = self.worksheet.title
+        return [{
+            'range': a1_range(title, r['start'], r['first'], r['end'], r['last']),
+            'values': r['values'],
+        } for r in ranges]
+
+    # ------------------------------------------------------------------
+    # Ejecución
+    # ------------------------------------------------------------------
+
+    def _send(self, func, payload, idempotent=True, **kwargs):
+        if metrics.current() is not None:
+            metrics.count('bytes_sent', len(json.dumps(payload, default=str)))
+        with metrics.span('sheets_write'):
+            call_with_retry(func, payload, idempotent=idempotent, **kwargs)
+        self.stats['api_calls'] += 1
+
+    def execute(self):
+        """Envía el plan a la hoja y devuelve las estadísticas de la ejecución."""
+        if not self.has_changes:
+            return self.stats
+        spreadsheet = self.worksheet.spreadsheet
+
+        structural = self._structural_requests()
+        for start in range(0, len(structural), MAX_STRUCTURAL_REQUESTS):
+            self._send(spreadsheet.batch_update, {'requests': structural[start:start + MAX_STRUCTURAL_REQUESTS]},
+                       idempotent=False)
+
+        data = self._value_ranges()
+        for chunk in _chunks_by_cells(data, lambda d: sum(len(v) for v in d['values'])):
+            self._send(spreadsheet.values_batch_update, {
+                'valueInputOption': self.value_input_option,
+                'data': chunk,
+            })
+
+        for chunk in _chunks_by_cells(self._appends, len):
+            self._send(self.worksheet.append_rows, chunk, idempotent=False,
+                       value_input_option=self.value_input_option, table_range='A1')
+
+        # Las filas nuevas no siempre heredan el formato de número de la columna
+        format_requests = number_format_requests(self.worksheet.id, self.formats)
+        if format_requests and (self._appends or self._inserts):
+            self._send(spreadsheet.batch_update, {'requests': format_requests})
+
+        _logger.info(
+            "Worksheet '%s' batch write: %d unchanged, %d updated, %d inserted, %d deleted, %d appended "
+            "in %d API call(s)",
+            self.worksheet.title, self.stats['unchanged'], self.stats['updated'], self.stats['inserted'],
+            self.stats['deleted'], self.stats['appended'], self.stats['api_calls'])
+        return self.stats
@@ -0,0 +1,149 @@
+# -*- coding: utf-8 -*-
+
+import hashlib
+import logging
+import threading
+import time
+from collections import OrderedDict
+
+from .retry import call_with_retry
+
+_logger = logging.getLogger(__name__)
+
+# Los tokens de una service account duran 60 minutos
+DEFAULT_TTL = 50 * 60
+DEFAULT_MAX_SIZE = 64
+
+
+def config_digest(*parts):
+    """Hash estable de los valores de configuración que identifican una conexión."""
+    sha = hashlib.sha256()
+    for part in parts:
+        sha.update((part or '').encode('utf-8'))
+        sha.update(b'\x00')
+    return sha.hexdigest()
+
+
+class SheetConnectionCache(object):
+    """Caché por proceso de clientes gspread, spreadsheets y worksheets.
+
+    Las entradas se indexan por un hash de la llave de la service account, la
+    URL y el nombre de la hoja, por lo que nunca se reutiliza una conexión
+    creada con otra configuración. Además:
+
+    - si la llave o la URL de un ``scope`` (base de datos) cambian, se
+      descartan todas las entradas de ese scope,
+    - una entrada caduca tras ``ttl`` segundos o cuando el token de sus
+      credenciales ha expirado,
+    - se guardan como máximo ``max_size`` entradas (LRU).
+    """
+
+    def __init__(self, ttl=DEFAULT_TTL, max_size=DEFAULT_MAX_SIZE):
+        self.ttl = ttl
+        self.max_size = max_size
+        self._entries = OrderedDict()   # (tipo, hash) -> (valor, credenciales, creado, scope)
+        self._fingerprints = {}         # scope -> hash(llave, url)
+        self._lock = threading.Lock()
+
+    def __len__(self):
+        return len(self._entries)
+
+    def clear(self, scope=None):
+        with self._lock:
+            if scope is None:
+                self._entries.clear()
+                self._fingerprints.clear()
+                return
+            self._drop(lambda entry: entry[3] == scope)
+            self._fingerprints.pop(scope, None)
+
+    def evict(self, value):
+        """Descarta las entradas que guardan ``value`` (p. ej. un worksheet que ya no existe)."""
+        with self._lock:
+            self._drop(lambda entry: entry[0] is value)
+
+    def _drop(self, predicate):
+        for cache_key in [k for k, entry in self._entries.items() if predicate(entry)]:
+            del self._entries[cache_key]
+
+    def _lookup(self, cache_key):
+        with self._lock:
+            entry = self._entries.get(cache_key)
+            if entry is None:
+                return None
+            value, creds, created, scope = entry
+            if time.monotonic() - created > self.ttl or getattr(creds, 'expired', False):
+                # Todo lo creado con esas credenciales deja de ser válido
+                _logger.info("Google Sheets connection cache entry expired, reconnecting")
+                self._drop(lambda e: e[1] is creds)
+                return None
+            self._entries.move_to_end(cache_key)
+            return entry
+
+    def _store(self, cache_key, value, creds, scope):
+        with self._lock:
+            self._entries[cache_key] = (value, creds, time.monotonic(), scope)
+            self._entries.move_to_end(cache_key)
+            while len(self._entries) > self.max_size:
+                self._entries.popitem(last=False)
+
+    def _check_scope(self, scope, fingerprint):
+        with self._lock:
+            previous = self._fingerprints.get(scope)
+            if previous is not None and previous != fingerprint:
+                _logger.info("Google Sheets configuration changed for '%s', dropping cached connections", scope)
+                self._drop(lambda entry: entry[3] == scope)
+            self._fingerprints[scope] = fingerprint
+
+    def get_worksheet(self, scope, key_content, sheet_url, worksheet_name, authorize):
+        """Devuelve el worksheet ``worksheet_name``, reutilizando lo que esté en caché.
+
+        ``authorize(key_content)`` sólo se llama si no hay un cliente válido y
+        debe devolver la tupla ``(cliente, credenciales)``.
+        """
+        self._check_scope(scope, config_digest(key_content, sheet_url))
+
+        worksheet_key = ('worksheet', config_digest(key_content, sheet_url, worksheet_name))
+        entry = self._lookup(worksheet_key)
+        if entry:
+            return entry[0]
+
+        spreadsheet, creds = self._get_spreadsheet(scope, key_content, sheet_url, authorize)
+        worksheet = call_with_retry(spreadsheet.worksheet, worksheet_name)
+        self._store(worksheet_key, worksheet, creds, scope)
+        return worksheet
+
+    def get_spreadsheet(self, scope, key_content, sheet_url, authorize):
+        """Devuelve la spreadsheet de ``sheet_url`` (p. ej. para crear hojas), igual que :meth:`get_worksheet`."""
+        self._check_scope(scope, config_digest(key_content, sheet_url))
+        return self._get_spreadsheet(scope, key_content, sheet_url, authorize)[0]
+
+    def _get_spreadsheet(self, scope, key_content, sheet_url, authorize):
+        spreadsheet_key = ('spreadsheet', config_digest(key_content, sheet_url))
+        entry = self._lookup(spreadsheet_key)
+        if entry:
+            return entry[0], entry[1]
+        client_key = ('client', config_digest(key_content))
+        entry = self._lookup(client_key)
+        if entry:
+            client, creds = entry[0], entry[1]
+        else:
+            client, creds = authorize(key_content)
+            self._store(client_key, client, creds, scope)
+        spreadsheet = call_with_retry(client.open_by_url, sheet_url)
+        self._store(spreadsheet_key, spreadsheet, creds, scope)
+        return spreadsheet, creds
+
+
+# Caché compartida por todos los modelos del worker
+SHEET_CONNECTIONS = SheetConnectionCache()
+
+
+def reopen_worksheet(worksheet):
+    """Vuelve a abrir ``worksheet`` por su título y descarta el handle viejo de la caché.
+
+    No usa la configuración ni el cursor, así que sirve también en los hilos de
+    escritura; la siguiente apertura normal guardará el handle nuevo en la caché.
+    """
+    SHEET_CONNECTIONS.evict(worksheet)
+    return call_with_retry(worksheet.spreadsheet.worksheet, worksheet.title)
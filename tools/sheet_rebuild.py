@@ -0,0 +1,176 @@
+# -*- coding: utf-8 -*-
+"""Reconstrucción completa de una hoja: limpiar y escribir todas las filas de una vez.
+
+A diferencia de :class:`~.sheet_batch.SheetWritePlan`, no se comparan ni
+mueven filas: el contenido se reemplaza con unas pocas llamadas
+``values.update`` de hasta ``MAX_CELLS_PER_CALL`` celdas, en orden. Con hoja
+de preparación (*staging*) las filas se escriben en una hoja aparte que al
+final sustituye a la original en un único ``batchUpdate`` atómico.
+"""
+
+import logging
+
+from . import metrics
+from .retry import call_with_retry
+from .row_format import number_format_requests, row_converter
+from .sheet_batch import a1_range, _chunks_by_cells
+from .sinks import ExportSink
+
+_logger = logging.getLogger(__name__)
+
+STAGING_SUFFIX = ' (rebuild)'
+# Filas que se añaden a la rejilla cada vez que se queda corta
+GROW_ROWS = 5000
+# Filas de la rejilla de una hoja creada al vuelo
+NEW_SHEET_ROWS = 100
+
+
+def staging_title(title):
+    return title + STAGING_SUFFIX
+
+
+def sheet_properties(spreadsheet, title):
+    """Propiedades (id, índice, rejilla) de la hoja ``title``, o ``None`` si no existe."""
+    metadata = call_with_retry(spreadsheet.fetch_sheet_metadata, {'fields': 'sheets.properties'})
+    for sheet in metadata.get('sheets', []):
+        properties = sheet.get('properties', {})
+        if properties.get('title') == title:
+            return properties
+    return None
+
+
+def _write_rows(worksheet, row, rows, width, value_input_option):
+    """Escribe ``rows`` a partir de ``row`` en llamadas de hasta ``MAX_CELLS_PER_CALL`` celdas."""
+    calls = 0
+    for chunk in _chunks_by_cells(rows, lambda r: width):
+        payload = {
+            'valueInputOption': value_input_option,
+            'data': [{
+                'range': a1_range(worksheet.title, row, 1, row + len(chunk) - 1, width),
+                'values': chunk,
+            }],
+        }
+        with metrics.span('sheets_write'):
+            call_with_retry(worksheet.spreadsheet.values_batch_update, payload)
+        row += len(chunk)
+        calls += 1
+    return calls
+
+
+def prepare_rebuild(worksheet, header, staging=True, hidden_columns=(), formats=None, value_input_option='RAW'):
+    """Deja lista la hoja donde se escribirán las filas y escribe el encabezado.
+
+    Con ``staging`` se (re)crea la hoja de preparación de ``worksheet``; sin
+    ella se limpia ``worksheet``. Las columnas ``hidden_columns`` (1-based) se
+    ocultan y se aplica el formato de número de ``formats``. Devuelve la hoja
+    donde se escribirán las filas (la staging recién creada tiene un id nuevo:
+    no debe volver a abrirse desde una caché).
+    """
+    spreadsheet = worksheet.spreadsheet
+    if staging:
+        title = staging_title(worksheet.title)
+        requests = []
+        previous = sheet_properties(spreadsheet, title)
+        if previous:
+            # Restos de una reconstrucción interrumpida
+            requests.append({'deleteSheet': {'sheetId': previous['sheetId']}})
+        requests.append({'addSheet': {'properties': {
+            'title': title,
+            'gridProperties': {'rowCount': GROW_ROWS, 'columnCount': len(header)},
+        }}})
+        call_with_retry(spreadsheet.batch_update, {'requests': requests}, idempotent=False)
+        target = call_with_retry(spreadsheet.worksheet, title)
+    else:
+        target = worksheet
+        call_with_retry(spreadsheet.values_clear, "'%s'" % worksheet.title.replace("'", "''"))
+    _write_header(target, header, hidden_columns, formats, value_input_option)
+    _logger.info("Worksheet '%s' ready for rebuild of '%s'", target.title, worksheet.title)
+    return target
+
+
+def _write_header(worksheet, header, hidden_columns, formats, value_input_option):
+    """Oculta ``hidden_columns``, aplica el formato de número de ``formats`` y escribe el encabezado."""
+    requests = [{'updateDimensionProperties': {
+        'range': {'sheetId': worksheet.id, 'dimension': 'COLUMNS', 'startIndex': col - 1, 'endIndex': col},
+        'properties': {'hiddenByUser': True},
+        'fields': 'hiddenByUser',
+    }} for col in hidden_columns] + number_format_requests(worksheet.id, formats)
+    if requests:
+        call_with_retry(worksheet.spreadsheet.batch_update, {'requests': requests})
+    _write_rows(worksheet, 1, [list(header)], len(header), value_input_option)
+
+
+def create_worksheet(spreadsheet, title, header, hidden_columns=(), formats=None, value_input_option='RAW'):
+    """Crea la hoja ``title`` al final de la spreadsheet, con su encabezado, y la devuelve.
+
+    La rejilla empieza con ``NEW_SHEET_ROWS`` filas: las celdas vacías cuentan
+    para el límite de celdas de la spreadsheet y las filas añadidas al final la
+    amplían por sí solas.
+    """
+    call_with_retry(spreadsheet.batch_update, {'requests': [{'addSheet': {'properties': {
+        'title': title,
+        'gridProperties': {'rowCount': NEW_SHEET_ROWS, 'columnCount': len(header)},
+    }}}]}, idempotent=False)
+    worksheet = call_with_retry(spreadsheet.worksheet, title)
+    _write_header(worksheet, header, hidden_columns, formats, value_input_option)
+    _logger.info("Worksheet '%s' created", title)
+    return worksheet
+
+
+def swap_worksheets(worksheet, staging):
+    """Sustituye ``worksheet`` por ``staging`` (mismo título y posición) en una sola llamada."""
+    spreadsheet = worksheet.spreadsheet
+    properties = sheet_properties(spreadsheet, worksheet.title)
+    index = properties.get('index', 0) if properties else 0
+    call_with_retry(spreadsheet.batch_update, {'requests': [
+        {'deleteSheet': {'sheetId': worksheet.id}},
+        {'updateSheetProperties': {
+            'properties': {'sheetId': staging.id, 'title': worksheet.title, 'index': index},
+            'fields': 'title,index',
+        }},
+    ]}, idempotent=False)
+    _logger.info("Worksheet '%s' replaced by its rebuilt copy", worksheet.title)
+
+
+class SheetRebuildSink(ExportSink):
+    """Escribe las filas en orden a partir de ``next_row``, sin buscar claves.
+
+    Todos los destinos se escriben en ``worksheet``: la reconstrucción es de
+    una sola hoja. Si la rejilla se queda corta se amplía ``GROW_ROWS`` filas.
+    """
+
+    # La reconstrucción escribe todo, pero deja las huellas al día
+    tracks_fingerprints = True
+
+    def __init__(self, worksheet, next_row=2, value_input_option='RAW'):
+        super().__init__()
+        self.worksheet = worksheet
+        self.next_row = next_row
+        self.value_input_option = value_input_option
+        self._grid_rows = None
+
+    def _ensure_rows(self, last_row, formats=None):
+        if self._grid_rows is None:
+            properties = sheet_properties(self.worksheet.spreadsheet, self.worksheet.title) or {}
+            self._grid_rows = properties.get('gridProperties', {}).get('rowCount', 0)
+            self.stats['api_calls'] += 1
+        if last_row <= self._grid_rows:
+            return
+        grow = max(GROW_ROWS, last_row - self._grid_rows)
+        # Las filas añadidas no heredan el formato de número: se vuelve a aplicar
+        call_with_retry(self.worksheet.spreadsheet.batch_update, {'requests': [{'appendDimension': {
+            'sheetId': self.worksheet.id, 'dimension': 'ROWS', 'length': grow,
+        }}] + number_format_requests(self.worksheet.id, formats)}, idempotent=False)
+        self._grid_rows += grow
+        self.stats['api_calls'] += 1
+
+    def write_blocks(self, target, blocks):
+        convert = row_converter(target.formats, sheets=True)
+        rows = [convert(row) for key, block in blocks for row in block]
+        if not rows:
+            return {'appended': 0}
+        self._ensure_rows(self.next_row + len(rows) - 1, target.formats)
+        calls = _write_rows(self.worksheet, self.next_row, rows, len(target.columns), self.value_input_option)
+        self.next_row += len(rows)
+        self.stats['api_calls'] += calls
+        return self._add_stats({'appended': len(rows)})
@@ -0,0 +1,292 @@
+# -*- coding: utf-8 -*-
+
+import contextvars
+import csv
+import logging
+import os
+import re
+from collections import OrderedDict, namedtuple
+from concurrent.futures import ThreadPoolExecutor
+
+try:
+    import pyarrow
+    import pyarrow.parquet
+except ImportError:
+    pyarrow = None
+
+from .retry import is_stale_worksheet_error
+from .row_format import row_converter
+from .sheet_batch import SheetWritePlan
+from .sheet_connection import reopen_worksheet
+
+_logger = logging.getLogger(__name__)
+
+STAT_KEYS = ('unchanged', 'updated', 'inserted', 'deleted', 'appended')
+
+# Destino lógico de las filas: una hoja (o archivo) con su columna clave y el
+# formato de cada columna (ver ``row_format``; ``None`` = todo texto)
+SinkTarget = namedtuple('SinkTarget', ['name', 'key_column', 'columns', 'diff', 'formats'], defaults=(None,))
+
+
+class ExportSink(object):
+    """Destino de las filas construidas por las exportaciones.
+
+    Los constructores de filas entregan bloques ``(clave, filas)`` por destino
+    con :meth:`write_blocks`; cada sink decide cómo persistirlos. Los bloques
+    pueden ser un generador: sólo los sinks que lo necesitan los materializan.
+    """
+
+    # Si el sink escribe en Google Sheets (se guardan las huellas de lo escrito)
+    # y si puede omitir los documentos cuya huella no cambió
+    tracks_fingerprints = False
+    skip_unchanged = False
+
+    def __init__(self):
+        self.stats = dict.fromkeys(STAT_KEYS, 0)
+        self.stats['api_calls'] = 0
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+
+    def _add_stats(self, stats):
+        for key in self.stats:
+            self.stats[key] += stats.get(key, 0)
+        return stats
+
+    def write_blocks(self, target, blocks):
+        """Escribe los bloques ``(clave, filas)`` en ``target`` y devuelve sus estadísticas."""
+        raise NotImplementedError()
+
+    def close(self):
+        return self.stats
+
+    def abort(self):
+        """Libera el sink tras un error, sin esperar a que se completen sus escrituras."""
+        try:
+            self.close()
+        except Exception:
+            _logger.exception("Error while closing export sink after a failure")
+
+
+class GoogleSheetSink(ExportSink):
+    """Upsert en Google Sheets mediante :class:`SheetWritePlan`.
+
+    ``open_worksheet(destino)`` devuelve el worksheet de un ``SinkTarget`` y
+    ``key_index`` es el modelo ``prompt.sheet.index`` que conserva la columna
+    de claves de cada hoja.
+
+    Con ``max_workers`` mayor que 1 las filas se construyen en el hilo que
+    llama (con el cursor de la exportación) y la escritura en Sheets se hace en
+    un pool de hilos: hojas distintas se escriben a la vez y los lotes de una
+    misma hoja se encadenan en orden. :meth:`write_blocks` devuelve entonces
+    estadísticas vacías; los totales quedan en :meth:`close`. Como mucho
+    ``2 * max_workers`` lotes esperan en memoria a ser escritos.
+    """
+
+    tracks_fingerprints = True
+    skip_unchanged = True
+
+    def __init__(self, open_worksheet, key_index, max_workers=1):
+        super().__init__()
+        self.open_worksheet = open_worksheet
+        self.key_index = key_index
+        self.max_workers = max_workers
+        self._executor = None
+        self._futures = []
+        self._last_future = {}
+
+    def write_blocks(self, target, blocks):
+        convert = row_converter(target.formats, sheets=True)
+        blocks = [(key, [convert(row) for row in rows]) for key, rows in blocks]
+        if not blocks:
+            return dict.fromkeys(STAT_KEYS, 0)
+        worksheet = self.open_worksheet(target)
+        if self.max_workers <= 1:
+            return self._add_stats(self._write(worksheet, target, blocks))
+
+        if self._executor is None:
+            self._executor = ThreadPoolExecutor(self.max_workers, thread_name_prefix='prompt_sheets')
+        # El hilo hereda el contexto para registrar en las métricas de la exportación
+        future = self._executor.submit(
+            contextvars.copy_context().run, self._write_after, self._last_future.get(target.name), worksheet, target, blocks)
+        self._last_future[target.name] = future
+        self._futures.append(future)
+        self._wait(2 * self.max_workers)
+        return dict.fromkeys(STAT_KEYS, 0)
+
+    def _write(self, worksheet, target, blocks):
+        try:
+            return self._write_plan(worksheet, target, blocks)
+        except Exception as e:
+            if not is_stale_worksheet_error(e):
+                raise
+        # Otro proceso reconstruyó la hoja y el handle en caché apunta a la hoja
+        # eliminada. El plan se basa en las claves, así que se repite con la hoja nueva.
+        _logger.info("Worksheet '%s' was replaced by another process, reopening it", worksheet.title)
+        return self._write_plan(reopen_worksheet(worksheet), target, blocks)
+
+    def _write_plan(self, worksheet, target, blocks):
+        keys = self.key_index._get_keys(worksheet, target.key_column)
+        plan = SheetWritePlan(worksheet, keys, formats=target.formats)
+        names = [key for key, rows in blocks]
+        if target.diff:
+            consistent = plan.prefetch(names, len(target.columns), key_column=target.key_column)
+        else:
+            # Sin diff las filas no se leen, pero sí su clave: un índice viejo
+            # (p. ej. tras ordenar la hoja) sobrescribiría las filas de otro folio
+            consistent = plan.verify_keys(names, target.key_column)
+        if not consistent:
+            # La hoja se editó fuera del exportador: reconstruir el índice
+            keys = self.key_index._get_keys(worksheet, target.key_column, force=True)
+            plan = SheetWritePlan(worksheet, keys, formats=target.formats)
+            if target.diff:
+                plan.prefetch(names, len(target.columns))
+        for key, rows in blocks:
+            plan.upsert(key, rows)
+        return self.key_index._execute_plan(plan, target.key_column)
+
+    def _write_after(self, previous, worksheet, target, blocks):
+        # El índice de claves de la hoja depende del lote anterior: si falló, éste también
+        if previous is not None:
+            previous.result()
+        return self._write(worksheet, target, blocks)
+
+    def _wait(self, pending):
+        """Espera los lotes más antiguos hasta que queden ``pending`` en curso."""
+        while len(self._futures) > pending:
+            self._add_stats(self._futures.pop(0).result())
+
+    def _shutdown(self):
+        if self._executor is not None:
+            self._executor.shutdown(wait=True)
+            self._executor = None
+        self._futures = []
+        self._last_future = {}
+
+    def close(self):
+        try:
+            self._wait(0)
+        finally:
+            self._shutdown()
+        return self.stats
+
+    def abort(self):
+        for future in self._futures:
+            future.cancel()
+        self._shutdown()
+
+
+class FileSink(ExportSink):
+    """Volcado en archivos CSV o Parquet, uno por destino, para exportaciones masivas.
+
+    Las filas se escriben en trozos de ``chunk_size`` a medida que llegan, por lo
+    que la memoria usada no depende del número de filas. No hay upsert: cada
+    bloque se añade al final del archivo.
+    """
+
+    def __init__(self, directory, file_format='csv', chunk_size=5000):
+        super().__init__()
+        if file_format not in ('csv', 'parquet'):
+            raise ValueError("Unsupported file format: %s" % file_format)
+        if file_format == 'parquet' and pyarrow is None:
+            raise ImportError("The 'pyarrow' library is required to export Parquet files.")
+        self.directory = directory
+        self.file_format = file_format
+        self.chunk_size = chunk_size
+        self.paths = {}
+        self._writers = {}
+
+    def _path(self, target):
+        filename = re.sub(r'[^\w.-]+', '_', target.name).strip('_') or 'export'
+        return os.path.join(self.directory, '%s.%s' % (filename, self.file_format))
+
+    def _writer(self, target):
+        if target.name not in self._writers:
+            path = self._path(target)
+            if self.file_format == 'csv':
+                handle = open(path, 'w', newline='', encoding='utf-8')
+                writer = csv.writer(handle)
+                writer.writerow(target.columns)
+                self._writers[target.name] = (handle, writer)
+            else:
+                schema = pyarrow.schema([(name, pyarrow.string()) for name in target.columns])
+                self._writers[target.name] = (None, pyarrow.parquet.ParquetWriter(path, schema))
+            self.paths[target.name] = path
+        return self._writers[target.name]
+
+    def _flush(self, target, rows):
+        handle, writer = self._writer(target)
+        if self.file_format == 'csv':
+            writer.writerows(rows)
+            return
+        width = len(target.columns)
+        columns = [[] for _ in range(width)]
+        for row in rows:
+            for idx in range(width):
+                columns[idx].append(str(row[idx]) if idx < len(row) else None)
+        writer.write_table(pyarrow.Table.from_arrays(
+            [pyarrow.array(values, pyarrow.string()) for values in columns],
+            names=list(target.columns)))
+
+    def write_blocks(self, target, blocks):
+        written = 0
+        buffer = []
+        convert = row_converter(target.formats)
+        for key, rows in blocks:
+            buffer.extend(convert(row) for row in rows)
+            if len(buffer) >= self.chunk_size:
+                self._flush(target, buffer)
+                written += len(buffer)
+                buffer = []
+        if buffer:
+            self._flush(target, buffer)
+            written += len(buffer)
+        elif target.name not in self._writers:
+            self._writer(target)
+        return self._add_stats({'appended': written})
+
+    def close(self):
+        for handle, writer in self._writers.values():
+            if handle is not None:
+                handle.close()
+            else:
+                writer.close()
+        self._writers.clear()
+        _logger.info("File export finished: %d row(s) written to %s", self.stats['appended'],
+                     ', '.join(sorted(self.paths.values())))
+        return self.stats
+
+
+class MemorySink(ExportSink):
+    """Sink en memoria con semántica de upsert, para pruebas y mediciones sin red.
+
+    Las filas se guardan con sus valores crudos, sin formatear.
+    """
+
+    def __init__(self):
+        super().__init__()
+        self.targets = {}
+
+    def write_blocks(self, target, blocks):
+        stats = dict.fromkeys(STAT_KEYS, 0)
+        sheet = self.targets.setdefault(target.name, OrderedDict())
+        for key, rows in blocks:
+            rows = [list(row) for row in rows]
+            current = sheet.get(key)
+            if current is None:
+                stats['appended'] += len(rows)
+            else:
+                for old, new in zip(current, rows):
+                    stats['unchanged' if old == new else 'updated'] += 1
+                stats['inserted'] += max(0, len(rows) - len(current))
+                stats['deleted'] += max(0, len(current) - len(rows))
+            sheet[key] = rows
+        self.stats['api_calls'] += 1
+        return self._add_stats(stats)
+
+    def rows(self, target_name):
+        """Todas las filas de un destino, en orden de escritura."""
+        return [row for rows in self.targets.get(target_name, {}).values() for row in rows]